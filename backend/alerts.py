@@ -0,0 +1,300 @@
+import ipaddress
+import queue
+import socket
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+import requests
+from models import AlertSubscription
+from timeseries import series_store, to_micros
+
+ALERT_KINDS = ("above", "below", "move")
+ALERT_CHANNELS = ("webhook", "email")
+DISPATCH_BATCH_SIZE = 100  # Max alerts sent per dispatch round
+DISPATCH_BATCH_WAIT = 2.0  # Seconds to wait for more alerts before dispatching a batch
+MICROS_PER_DAY = 86_400_000_000
+ALERTS_STAMP = Path("./data/alerts.stamp")  # Touched whenever alert subscriptions change
+
+
+def _threshold(entry):
+    return entry[0]
+
+
+def check_webhook_target(url):
+    """
+    Check that a webhook URL is http(s) and points at a public host.
+    The worker POSTs to these URLs, so a host on a private network (e.g. another
+    service on the compose network) must not be reachable through an alert.
+    Args:
+        url (str): The webhook URL.
+    Raises:
+        ValueError: If the URL isn't usable as a webhook.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Webhook must be an http(s) URL")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"Could not resolve webhook host: {parts.hostname}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise ValueError(f"Webhook host is not public: {parts.hostname}")
+
+
+def mark_alerts_changed():
+    """
+    Tell the workers' alert engines to reload subscriptions before their next batch.
+    Call after committing changes to the alert_subscriptions table.
+    """
+    ALERTS_STAMP.parent.mkdir(parents=True, exist_ok=True)
+    ALERTS_STAMP.touch()
+
+
+class AlertDispatcher:
+    """
+    Sends triggered alerts from a background thread, batched per destination.
+    """
+
+    def __init__(self, batch_size=DISPATCH_BATCH_SIZE, batch_wait=DISPATCH_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, alerts):
+        """
+        Queue triggered alerts for delivery without blocking the caller.
+        Args:
+            alerts (list[dict]): Triggered alerts, each with "channel" and "target".
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._thread.start()
+        for alert in alerts:
+            self._queue.put(alert)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.batch_wait))
+            except queue.Empty:
+                pass
+            self.send(batch)
+
+    def send(self, batch):
+        """
+        Deliver a batch of alerts, one message per destination.
+        Args:
+            batch (list[dict]): Triggered alerts.
+        """
+        destinations = {}
+        for alert in batch:
+            destinations.setdefault((alert["channel"], alert["target"]), []).append(alert)
+
+        for (channel, target), alerts in destinations.items():
+            try:
+                if channel == "webhook":
+                    # Checked again here since the host's addresses can change after subscribing
+                    check_webhook_target(target)
+                    response = requests.post(target, json={"alerts": alerts}, timeout=10, allow_redirects=False)
+                    response.raise_for_status()
+                else:
+                    # Email stand-in until an SMTP relay is configured
+                    lines = "\n".join(f"  {a['commodity']}: {a['message']}" for a in alerts)
+                    print(f"Email to {target}: {len(alerts)} price alert(s)\n{lines}")
+            except Exception as e:
+                print(f"Error sending {len(alerts)} alert(s) to {target}: {e}")
+
+
+class AlertEngine:
+    """
+    Evaluates price alert subscriptions against each new price.
+    Subscriptions are indexed per commodity term in lists sorted by threshold, so a
+    new price only touches the subscriptions whose threshold it actually crosses:
+    a binary search on each side of the move from the previous price.
+    """
+
+    def __init__(self, dispatcher=None, stamp_file=ALERTS_STAMP):
+        self.dispatcher = dispatcher or AlertDispatcher()
+        self.stamp_file = Path(stamp_file)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._loaded = False
+        self._subscriptions = {}  # id -> subscription dict
+        self._above = {}  # term -> [(threshold, id)] sorted
+        self._below = {}  # term -> [(threshold, id)] sorted
+        self._moves = {}  # term -> {window_days: [(threshold, id)] sorted}
+        self._terms = {}  # commodity name -> matching terms
+
+    def load(self, session):
+        """
+        Load every subscription from the database, replacing the in-memory index.
+        Args:
+            session (Session): A SQLAlchemy session.
+        """
+        # Record the stamp before reading, so a change made during the load triggers another
+        stamp = self.stamp_file.stat().st_mtime_ns if self.stamp_file.exists() else None
+        subscriptions = [_as_dict(subscription) for subscription in session.query(AlertSubscription).all()]
+
+        # Build the new index aside and sort each list once, rather than inserting one at a time
+        with self._lock:
+            self._subscriptions, self._above, self._below, self._moves, self._terms = {}, {}, {}, {}, {}
+            for sub in subscriptions:
+                self._subscriptions[sub["id"]] = sub
+                self._index_for(sub, sub["commodity"].lower(), create=True).append((sub["threshold"], sub["id"]))
+            for index in [*self._above.values(), *self._below.values()] + \
+                         [moves for windows in self._moves.values() for moves in windows.values()]:
+                index.sort()
+            self._stamp, self._loaded = stamp, True
+        print(f"Loaded {len(subscriptions)} alert subscriptions.")
+
+    def refresh(self, session):
+        """
+        Reload the subscriptions if they have changed since the last load (see mark_alerts_changed()).
+        Args:
+            session (Session): A SQLAlchemy session.
+        """
+        stamp = self.stamp_file.stat().st_mtime_ns if self.stamp_file.exists() else None
+        if not self._loaded or stamp != self._stamp:
+            self.load(session)
+
+    def add(self, subscription):
+        """
+        Add a subscription to the index.
+        Args:
+            subscription (AlertSubscription): The stored subscription.
+        """
+        sub = _as_dict(subscription)
+        term = sub["commodity"].lower()
+        with self._lock:
+            self._subscriptions[sub["id"]] = sub
+            insort(self._index_for(sub, term, create=True), (sub["threshold"], sub["id"]))
+            self._terms.clear()
+
+    def remove(self, subscription_id):
+        """
+        Remove a subscription from the index.
+        Args:
+            subscription_id (int): The subscription id.
+        """
+        with self._lock:
+            sub = self._subscriptions.pop(subscription_id, None)
+            if sub is None:
+                return
+            index = self._index_for(sub, sub["commodity"].lower())
+            position = bisect_left(index, (sub["threshold"], sub["id"]))
+            if position < len(index) and index[position][1] == sub["id"]:
+                index.pop(position)
+
+    def _index_for(self, sub, term, create=False):
+        if sub["kind"] == "move":
+            windows = self._moves.setdefault(term, {}) if create else self._moves.get(term, {})
+            return windows.setdefault(sub["window_days"], []) if create else windows.get(sub["window_days"], [])
+        indexes = self._above if sub["kind"] == "above" else self._below
+        return indexes.setdefault(term, []) if create else indexes.get(term, [])
+
+    def _matching_terms(self, commodity):
+        terms = self._terms.get(commodity)
+        if terms is None:
+            name = commodity.lower()
+            all_terms = set(self._above) | set(self._below) | set(self._moves)
+            terms = self._terms[commodity] = [t for t in all_terms if t in name]
+        return terms
+
+    def on_price(self, commodity, price, timestamp):
+        """
+        Evaluate a new price and queue any alerts it triggers.
+        Must be called before the price is appended to the series store, which
+        supplies the previous price and the look-back prices for moves.
+        Args:
+            commodity (str): The full commodity name.
+            price (float): The new price.
+            timestamp (datetime or str): The timestamp of the new price.
+        Returns:
+            list[dict]: The triggered alerts.
+        """
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        timestamps, prices = series_store.range(commodity, end=timestamp)
+        if len(prices) == 0:
+            return []  # Nothing to cross from yet
+        previous, previous_at = float(prices[-1]), int(timestamps[-1])
+
+        triggered = []
+        with self._lock:
+            for term in self._matching_terms(commodity):
+                # Thresholds in (previous, price] were crossed upwards
+                above = self._above.get(term, [])
+                lo = bisect_right(above, previous, key=_threshold)
+                hi = bisect_right(above, price, key=_threshold)
+                triggered += [(above[i][1], f"rose above {above[i][0]} to {price}") for i in range(lo, hi)]
+
+                # Thresholds in [price, previous) were crossed downwards
+                below = self._below.get(term, [])
+                lo = bisect_left(below, price, key=_threshold)
+                hi = bisect_left(below, previous, key=_threshold)
+                triggered += [(below[i][1], f"fell below {below[i][0]} to {price}") for i in range(lo, hi)]
+
+                for window_days, moves in self._moves.get(term, {}).items():
+                    if not moves:
+                        continue
+                    move = self._move(commodity, price, timestamp, window_days)
+                    previous_move = self._move(commodity, previous, previous_at, window_days)
+                    if move is None:
+                        continue
+                    # Percentages in (previous move, move] were newly exceeded
+                    lo = bisect_right(moves, previous_move or 0.0, key=_threshold)
+                    hi = bisect_right(moves, move, key=_threshold)
+                    triggered += [
+                        (moves[i][1], f"moved {move:.2f}% over {window_days} days (alert at {moves[i][0]}%)")
+                        for i in range(lo, hi)
+                    ]
+
+            alerts = [
+                {
+                    "subscription_id": sub_id,
+                    "commodity": commodity,
+                    "kind": self._subscriptions[sub_id]["kind"],
+                    "threshold": self._subscriptions[sub_id]["threshold"],
+                    "price": price,
+                    "timestamp": timestamp.isoformat(),
+                    "message": message,
+                    "channel": self._subscriptions[sub_id]["channel"],
+                    "target": self._subscriptions[sub_id]["target"],
+                } for sub_id, message in triggered
+            ]
+
+        if alerts:
+            self.dispatcher.enqueue(alerts)
+        return alerts
+
+    def _move(self, commodity, price, at, window_days):
+        # Absolute percentage move against the last price at least window_days earlier
+        cutoff = to_micros(at) - window_days * MICROS_PER_DAY
+        _, prices = series_store.range(commodity, end=cutoff)
+        if len(prices) == 0 or prices[-1] == 0:
+            return None
+        return abs(price / float(prices[-1]) - 1) * 100
+
+
+def _as_dict(subscription):
+    return {
+        "id": subscription.id,
+        "commodity": subscription.commodity,
+        "kind": subscription.kind,
+        "threshold": subscription.threshold,
+        "window_days": subscription.window_days,
+        "channel": subscription.channel,
+        "target": subscription.target,
+    }
+
+
+# Prices are only written by the scrape workers, so this is only loaded there
+alert_engine = AlertEngine()
@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from db import SessionLocal
+from models import ArchivedPage
+
+try:
+    import zstandard
+except ImportError:  # Fall back to zlib where the zstd bindings aren't installed
+    zstandard = None
+
+ARCHIVE_DIR = Path("./data/archive")
+ZSTD_LEVEL = 10
+
+_collected = threading.local()
+
+
+def content_hash(content: bytes):
+    """
+    Get the archive key for some page content.
+    Args:
+        content (bytes): The page content.
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def _object_paths(page_hash):
+    base = ARCHIVE_DIR / page_hash[:2] / page_hash
+    return base.with_suffix(".zst"), base.with_suffix(".zlib")
+
+
+def archive_page(url: str, content: bytes, fetched_at: datetime = None):
+    """
+    Store a fetched page in the archive and record the fetch.
+    The content is only written if no earlier fetch had identical content. Inside
+    collect_pages() the fetch is handed back to the caller to record instead.
+    Args:
+        url (str): The URL that was fetched.
+        content (bytes): The page content.
+        fetched_at (datetime, optional): When the page was fetched. Defaults to now.
+    Returns:
+        str: The page hash.
+    """
+    page_hash = content_hash(content)
+    zst_path, zlib_path = _object_paths(page_hash)
+    if not zst_path.exists() and not zlib_path.exists():
+        if zstandard is not None:
+            path, data = zst_path, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(content)
+        else:
+            path, data = zlib_path, zlib.compress(content, 9)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    page = {"url": url, "page_hash": page_hash, "size": len(content), "fetched_at": fetched_at or datetime.now()}
+    collected = getattr(_collected, "pages", None)
+    if collected is not None:
+        collected.append(page)
+    else:
+        record_pages([page])
+    return page_hash
+
+
+@contextmanager
+def collect_pages():
+    """
+    Collect the fetches archived in this thread instead of recording them.
+    Scrape processes use this so only the parent process writes to the database.
+    Yields:
+        list[dict]: The archived fetches, filled in as the block runs; pass them to record_pages().
+    """
+    previous = getattr(_collected, "pages", None)
+    _collected.pages = []
+    try:
+        yield _collected.pages
+    finally:
+        _collected.pages = previous
+
+
+def record_pages(pages):
+    """
+    Record archived fetches in the archived_pages table in one transaction.
+    Args:
+        pages (list[dict]): Fetches as collected by collect_pages().
+    """
+    if not pages:
+        return
+    session = SessionLocal()
+    try:
+        session.add_all([ArchivedPage(**page) for page in pages])
+        session.commit()
+    finally:
+        session.close()
+
+
+def read_page(page_hash: str):
+    """
+    Read a page back from the archive.
+    Args:
+        page_hash (str): The page hash.
+    Returns:
+        bytes: The page content.
+    Raises:
+        FileNotFoundError: If the page isn't in the archive.
+    """
+    zst_path, zlib_path = _object_paths(page_hash)
+    if zst_path.exists():
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed pages")
+        return zstandard.ZstdDecompressor().decompress(zst_path.read_bytes())
+    if zlib_path.exists():
+        return zlib.decompress(zlib_path.read_bytes())
+    raise FileNotFoundError(f"Page {page_hash} is not in the archive")
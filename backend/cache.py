@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+HISTORY_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 32 MB of serialized responses
+INVALIDATION_LOG = Path("./data/cache_invalidations.log")  # Shared with the scrape workers
+
+
+class HistoryCache:
+    """
+    LRU cache of serialized /history responses, bounded by total bytes.
+    Entries are grouped by the commodity search term they were requested with, and
+    are dropped when a new price is written for a commodity that term matches, so
+    there is no TTL: a cached range stays valid until its data actually changes.
+    Writes made in other processes (the scrape workers) reach the cache through an
+    append-only invalidation log that sync() tails.
+    Attributes:
+        max_bytes (int): Upper bound on the total size of cached bodies.
+        log_file (Path): The shared invalidation log, or None for a process-local cache.
+        generation (int): Incremented on every invalidation.
+    """
+
+    def __init__(self, max_bytes=HISTORY_CACHE_MAX_BYTES, log_file=None):
+        self.max_bytes = max_bytes
+        self.log_file = Path(log_file) if log_file else None
+        self._log_offset = None
+        self.generation = 0
+        self.size = 0
+        self._entries = OrderedDict()  # (term, key) -> body
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def get(self, term, key):
+        """
+        Get a cached response body, marking it as recently used.
+        Args:
+            term (str): The commodity search term from the request.
+            key (tuple): The rest of the request (endpoint, range, options).
+        Returns:
+            bytes or None: The cached body, or None on a miss.
+        """
+        entry_key = (term.lower(), key)
+        with self._lock:
+            body = self._entries.get(entry_key)
+            if body is not None:
+                self._entries.move_to_end(entry_key)
+            return body
+
+    def put(self, term, key, body, generation):
+        """
+        Cache a response body, evicting the least recently used entries to stay in bounds.
+        Args:
+            term (str): The commodity search term from the request.
+            key (tuple): The rest of the request (endpoint, range, options).
+            body (bytes): The serialized response.
+            generation (int): The cache generation read before the body was loaded.
+                The body is discarded if a write happened in the meantime.
+        """
+        if len(body) > self.max_bytes:
+            return
+        entry_key = (term.lower(), key)
+        with self._lock:
+            if generation != self.generation:
+                return
+            old = self._entries.pop(entry_key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[entry_key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, commodity, publish=True):
+        """
+        Drop every entry whose search term matches a commodity that just got a new price.
+        Args:
+            commodity (str): The full commodity name that was written.
+            publish (bool): Also record the write in the shared log for other processes.
+        """
+        if publish and self.log_file is not None:
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_file, "a") as f:
+                f.write(commodity + "\n")
+
+        commodity = commodity.lower()
+        with self._lock:
+            self.generation += 1
+            for entry_key in [k for k in self._entries if k[0] in commodity]:
+                self.size -= len(self._entries.pop(entry_key))
+
+    def sync(self):
+        """
+        Apply invalidations logged by other processes since the last sync.
+        Costs a single stat() when nothing has been written.
+        """
+        if self.log_file is None:
+            return
+        with self._sync_lock:
+            size = self.log_file.stat().st_size if self.log_file.exists() else 0
+            if self._log_offset is None or size < self._log_offset:
+                # First sync, or the log was truncated: anything cached may be stale
+                if self._log_offset is not None:
+                    self.clear()
+                self._log_offset = size
+                return
+            if size == self._log_offset:
+                return
+
+            with open(self.log_file, "rb") as f:
+                f.seek(self._log_offset)
+                written = f.read(size - self._log_offset)
+            # Leave a partially written last line for the next sync
+            written = written[:written.rfind(b"\n") + 1]
+            self._log_offset += len(written)
+
+        for commodity in set(written.decode().splitlines()):
+            self.invalidate(commodity, publish=False)
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.size = 0
+
+
+history_cache = HistoryCache(log_file=INVALIDATION_LOG)
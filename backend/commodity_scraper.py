@@ -1,11 +1,17 @@
+import json
+import os
 import requests
 import re
 from bs4 import BeautifulSoup
 from datetime import datetime
 from currency import get_usd_to_aud
 from models import Price
-from db import SessionLocal, init_db
+from db import SessionLocal, init_db, insert_prices
 from sqlalchemy.orm import Session
+from profiling import span
+from archive import archive_page, content_hash
+
+FETCH_TIMEOUT = 30  # Seconds to wait on a source before failing the scrape
 
 
 def scrape_commodity(commodity: str):
@@ -32,19 +38,66 @@ def scrape_commodity(commodity: str):
         raise ValueError(f"Unsupported commodity: {commodity}")
 
 
+def fetch_page(url, headers=None, session=None, archive=True, **kwargs):
+    """
+    Download a page for a scraper and archive it, timed as the "fetch" and "archive" stages of a scrape cycle.
+    Args:
+        url (str): The URL to fetch.
+        headers (dict, optional): Request headers.
+        session (requests.Session, optional): Session to fetch with, for cookies.
+        archive (bool): Archive the page. Off for requests that only bootstrap a session,
+            whose pages no parser reads.
+        **kwargs: Passed through to requests (e.g. params). The timeout defaults to FETCH_TIMEOUT.
+    Returns:
+        requests.Response: The response.
+    Raises:
+        requests.HTTPError: If the request fails.
+    """
+    kwargs.setdefault("timeout", FETCH_TIMEOUT)
+    with span("fetch"):
+        response = (session or requests).get(url, headers=headers, **kwargs)
+        response.raise_for_status()  # Raise error if request fails
+    if not archive:
+        return response
+
+    # Keep the raw page so history can be re-parsed if a parser turns out to be wrong
+    try:
+        with span("archive"):
+            archive_page(url, response.content)
+    except Exception as e:
+        print(f"Error archiving {url}: {e}")
+    return response
+
+COTLOOK_URL = "https://www.cotlook.com"
+DPI_REPORT_URL = "https://www.dpi.nsw.gov.au/agriculture/commodity-report"
+ABARES_URL = "https://www.agriculture.gov.au/abares/data/weekly-commodity-price-update"
+
 # Scrape cotton price from Cotlook A Index
 def scrape_cotton():
-    url = "https://www.cotlook.com"
-
     headers = {
         "User-Agent": "Mozilla/5.0 (compatible; CottonScraper/1.0)",
         "Accept": "text/html,application/xhtml+xml",
     }
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raise error if request fails
+    response = fetch_page(COTLOOK_URL, headers=headers)
+
+    # Convert price to AUD$/bale
+    exchange_rate = get_usd_to_aud()
+    if exchange_rate is None:
+        raise ValueError("Could not fetch exchange rate for USD to AUD")
+    return parse_cotton(response.content, exchange_rate)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+def parse_cotton(content, exchange_rate):
+    """
+    Parse the Cotlook A Index from the Cotlook home page.
+    Args:
+        content (bytes): The page content.
+        exchange_rate (float): The USD to AUD exchange rate.
+    Returns:
+        dict: The price data.
+    """
+    url = COTLOOK_URL
+    soup = BeautifulSoup(content, "html.parser")
 
     # Get the A Index row
     row = soup.find("tr", id="aIndex")
@@ -56,10 +109,6 @@ def scrape_cotton():
         raise ValueError("Not enough cells in A Index row")
 
     price = float(cells[0].text.strip())
-    # Convert price to AUD$/bale
-    exchange_rate = get_usd_to_aud()
-    if exchange_rate is None:
-        raise ValueError("Could not fetch exchange rate for USD to AUD")
     price_aud = round(((price * exchange_rate) / 100) * 500, 2)  # Convert from USc to AUD
 
     change = cells[1].text.strip()
@@ -79,368 +128,192 @@ def scrape_cotton():
         "unit": "$/bale",
         "source": url,
         "timestamp": date,
+        "native_price": price,
+        "native_currency": "USD",
+        "native_unit": "c/lb",
+        "fx_rate": exchange_rate,
+        "page_hash": content_hash(content),
     }
 
+# Number of deferred cotton futures contracts tracked alongside cash
+COTTON_FUTURES_CONTRACTS = int(os.getenv("COTTON_FUTURES_CONTRACTS", "4"))
+
+BARCHART_CHAIN_PAGE = "https://www.barchart.com/futures/quotes/CT*0/futures-prices"
+BARCHART_QUOTES_API = "https://www.barchart.com/proxies/core-api/v1/quotes/get"
+BARCHART_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+
 def scrape_cotton_futures():
     """
-    Scrape the 5 most recent cotton futures contracts including cash from Barchart.
-    Returns a list of contract data.
+    Scrape the cotton futures curve from Barchart.
+    Returns:
+        dict: The first contract (cash) for backward compatibility
+            (the app expects a single dict, not a list).
     """
-    from datetime import datetime as dt
-    
-    # Cotton futures trade with contract months: March (H), May (K), July (N), October (V), December (Z)
-    current_month = dt.now().month
-    current_year = dt.now().year % 100  # Get last 2 digits of year
-    next_year = (current_year + 1) % 100
-    
-    # Define the contract month codes and their corresponding months
-    contract_months = [
-        (3, "H"),   # March
-        (5, "K"),   # May
-        (7, "N"),   # July
-        (10, "V"),  # October
-        (12, "Z")   # December
-    ]
-    
-    # Build list of 5 most recent contracts including cash
-    contracts_to_scrape = []
-    
-    # Add cash/spot contract
-    contracts_to_scrape.append(("Cotton Cash", "https://www.barchart.com/futures/quotes/cotton"))
-    
-    # Generate next 4 contract months
-    contracts_added = 0
-    year_to_check = current_year
-    
-    for _ in range(2):  # Check current and next year
-        for month_num, month_code in contract_months:
-            if contracts_added >= 4:  # We want 4 futures + 1 cash = 5 total
-                break
-                
-            # Only add contracts that are in the future or current month
-            if year_to_check == current_year and month_num < current_month:
-                continue
-                
-            symbol = f"CT{month_code}{year_to_check:02d}"
-            url = f"https://www.barchart.com/futures/quotes/{symbol}"
-            contracts_to_scrape.append((f"Cotton {month_code}{year_to_check:02d}", url))
-            contracts_added += 1
-            
-        year_to_check = next_year
-        if contracts_added >= 4:
-            break
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    
-    def scrape_single_contract(contract_name, url):
-        """Scrape a single cotton contract"""
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text()
-            
-            price_data = None
-            change_data = None
-            change_percent = None
-            
-            # Method 1: Look for "Last Price" pattern in text
-            last_price_match = re.search(r'Last Price[:\s]*([0-9]+\.?[0-9]*)', page_text, re.IGNORECASE)
-            if last_price_match:
-                potential_price = float(last_price_match.group(1))
-                if 40 < potential_price < 200:  # Reasonable cotton price range in cents
-                    price_data = potential_price
-            
-            # Method 2: Look for price patterns in the text content
-            if not price_data:
-                price_patterns = re.findall(r'([0-9]{2,3}\.[0-9]{1,2})[s]?', page_text)
-                for price_str in price_patterns:
-                    potential_price = float(price_str)
-                    if 40 < potential_price < 200:
-                        price_data = potential_price
-                        break
-            
-            # Method 3: Look in specific HTML elements
-            if not price_data:
-                for tag in ['span', 'div', 'td']:
-                    elements = soup.find_all(tag, string=re.compile(r'[0-9]{2,3}\.[0-9]{2}'))
-                    for elem in elements:
-                        text = elem.get_text(strip=True)
-                        price_match = re.search(r'([0-9]{2,3}\.[0-9]{2})', text)
-                        if price_match:
-                            potential_price = float(price_match.group(1))
-                            if 40 < potential_price < 200:
-                                price_data = potential_price
-                                break
-                    if price_data:
-                        break
-            
-            # If we found price data, look for change data
-            if price_data:
-                # Look for change patterns
-                change_patterns = re.findall(r'([+-][0-9]+\.[0-9]+)', page_text)
-                if change_patterns:
-                    try:
-                        change_data = float(change_patterns[0])
-                    except (ValueError, IndexError):
-                        pass
-                
-                # Look for percentage patterns
-                percent_patterns = re.findall(r'([+-]?[0-9]+\.[0-9]+)%', page_text)
-                if percent_patterns:
-                    try:
-                        change_percent = float(percent_patterns[0])
-                    except (ValueError, IndexError):
-                        pass
-            
-            if not price_data:
-                return None
-            
-            # Convert price from US cents to AUD$/bale
-            exchange_rate = get_usd_to_aud()
-            if exchange_rate is None:
-                return None
-            
-            # Cotton futures are in US cents per pound, convert to AUD$/bale
-            price_aud = round(((price_data * exchange_rate) / 100) * 500, 2)
-            
-            # Use percentage change if available, otherwise calculate from raw change
-            if change_percent is not None:
-                final_change = change_percent
-            elif change_data is not None:
-                previous_price = price_data - change_data
-                if previous_price != 0:
-                    final_change = round((change_data / previous_price) * 100, 2)
-                else:
-                    final_change = 0.0
-            else:
-                final_change = 0.0
-            
-            return {
-                "commodity": f"Cotton ({contract_name})",
-                "price": price_aud,
-                "currency": "AUD",
-                "change": final_change,
-                "unit": "$/bale",
-                "source": url,
-                "timestamp": datetime.now(),
-            }
-            
-        except Exception:
-            return None
-    
-    # Scrape all contracts
-    results = []
-    for contract_name, url in contracts_to_scrape:
-        contract_data = scrape_single_contract(contract_name, url)
-        if contract_data:
-            results.append(contract_data)
-    
-    if not results:
-        raise ValueError("Could not extract any cotton futures prices from Barchart")
-    
-    # Return the first successful contract for backward compatibility
-    # (the app expects a single dict, not a list)
-    return results[0]
+    return scrape_cotton_futures_all()[0]
+
 
-def scrape_cotton_futures_all():
+def scrape_cotton_futures_all(contracts: int = COTTON_FUTURES_CONTRACTS):
     """
-    Scrape all 5 cotton futures contracts including cash from Barchart.
-    Returns a list of all contract data.
+    Scrape the whole cotton futures chain (cash plus deferred contracts) from Barchart.
+    The chain comes from Barchart's quotes endpoint in one request, after one page
+    load to pick up the session cookie the endpoint requires.
+    Args:
+        contracts (int): Number of deferred futures contracts to return after cash.
+    Returns:
+        list[dict]: Price data for each contract, cash first.
+    Raises:
+        ValueError: If no contracts could be extracted.
     """
-    from datetime import datetime as dt
-    
-    # Cotton futures trade with contract months: March (H), May (K), July (N), October (V), December (Z)
-    current_month = dt.now().month
-    current_year = dt.now().year % 100  # Get last 2 digits of year
-    current_full_year = dt.now().year
-    
-    # Define the contract month codes and their corresponding months
-    contract_months = [
-        (3, "H"),   # March
-        (5, "K"),   # May
-        (7, "N"),   # July
-        (10, "V"),  # October
-        (12, "Z")   # December
-    ]
-    
-    # Build list of 5 most recent contracts including cash
-    contracts_to_scrape = []
-    
-    # Add cash/spot contract - this will show as CTY00 (Cash)
-    contracts_to_scrape.append(("Cotton Cash", "https://www.barchart.com/futures/quotes/cotton"))
-    
-    # Generate the next 4-5 active contract months starting from current/next active month
-    all_possible_contracts = []
-    
-    # Build list of all possible contracts for the next 18 months
-    for year_offset in range(3):  # Check current year and next 2 years
-        check_year = (current_year + year_offset) % 100
-        check_full_year = current_full_year + year_offset
-        
-        for month_num, month_code in contract_months:
-            # For current year, only add contracts that haven't expired (or are in current month)
-            if year_offset == 0 and month_num < current_month:
-                continue
-            
-            # Create contract date for sorting
-            contract_date = dt(check_full_year, month_num, 1)
-            
-            all_possible_contracts.append({
-                'symbol': f"CT{month_code}{check_year:02d}",
-                'name': f"Cotton {month_code}{check_year:02d}",
-                'url': f"https://www.barchart.com/futures/quotes/CT{month_code}{check_year:02d}",
-                'date': contract_date,
-                'month_code': month_code,
-                'year': check_year
-            })
-    
-    # Sort by date to get the most current contracts first
-    all_possible_contracts.sort(key=lambda x: x['date'])
-    
-    # Take the first 4 contracts (most immediate/liquid)
-    for contract in all_possible_contracts[:4]:
-        contracts_to_scrape.append((contract['name'], contract['url']))
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-    
-    def scrape_single_contract(contract_name, url):
-        """Scrape a single cotton contract"""
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, "html.parser")
-            page_text = soup.get_text()
-            
-            price_data = None
-            change_data = None
-            change_percent = None
-            
-            # Method 1: Look for "Last Price" pattern in text
-            last_price_match = re.search(r'Last Price[:\s]*([0-9]+\.?[0-9]*)', page_text, re.IGNORECASE)
-            if last_price_match:
-                potential_price = float(last_price_match.group(1))
-                if 40 < potential_price < 200:  # Reasonable cotton price range in cents
-                    price_data = potential_price
-            
-            # Method 2: Look for price patterns in the text content
-            if not price_data:
-                price_patterns = re.findall(r'([0-9]{2,3}\.[0-9]{1,2})[s]?', page_text)
-                for price_str in price_patterns:
-                    potential_price = float(price_str)
-                    if 40 < potential_price < 200:
-                        price_data = potential_price
-                        break
-            
-            # Method 3: Look in specific HTML elements
-            if not price_data:
-                for tag in ['span', 'div', 'td']:
-                    elements = soup.find_all(tag, string=re.compile(r'[0-9]{2,3}\.[0-9]{2}'))
-                    for elem in elements:
-                        text = elem.get_text(strip=True)
-                        price_match = re.search(r'([0-9]{2,3}\.[0-9]{2})', text)
-                        if price_match:
-                            potential_price = float(price_match.group(1))
-                            if 40 < potential_price < 200:
-                                price_data = potential_price
-                                break
-                    if price_data:
-                        break
-            
-            # If we found price data, look for change data
-            if price_data:
-                # Look for change patterns
-                change_patterns = re.findall(r'([+-][0-9]+\.[0-9]+)', page_text)
-                if change_patterns:
-                    try:
-                        change_data = float(change_patterns[0])
-                    except (ValueError, IndexError):
-                        pass
-                
-                # Look for percentage patterns
-                percent_patterns = re.findall(r'([+-]?[0-9]+\.[0-9]+)%', page_text)
-                if percent_patterns:
-                    try:
-                        change_percent = float(percent_patterns[0])
-                    except (ValueError, IndexError):
-                        pass
-            
-            if not price_data:
-                return None
-            
-            # Convert price from US cents to AUD$/bale
-            exchange_rate = get_usd_to_aud()
-            if exchange_rate is None:
-                return None
-            
-            # Cotton futures are in US cents per pound, convert to AUD$/bale
-            price_aud = round(((price_data * exchange_rate) / 100) * 500, 2)
-            
-            # Use percentage change if available, otherwise calculate from raw change
-            if change_percent is not None:
-                final_change = change_percent
-            elif change_data is not None:
-                previous_price = price_data - change_data
-                if previous_price != 0:
-                    final_change = round((change_data / previous_price) * 100, 2)
-                else:
-                    final_change = 0.0
-            else:
-                final_change = 0.0
-            
-            return {
-                "commodity": f"Cotton ({contract_name})",
-                "price": price_aud,
-                "currency": "AUD",
-                "change": final_change,
-                "unit": "$/bale",
-                "source": url,
-                "timestamp": datetime.now(),
-            }
-            
-        except Exception:
-            return None
-    
-    # Scrape all contracts
-    results = []
-    for contract_name, url in contracts_to_scrape:
-        contract_data = scrape_single_contract(contract_name, url)
-        if contract_data:
-            results.append(contract_data)
-    
+    session = requests.Session()
+    session.headers.update(BARCHART_HEADERS)
+
+    # The quotes endpoint rejects requests without the XSRF token set by the page
+    fetch_page(BARCHART_CHAIN_PAGE, session=session, archive=False)
+    xsrf_token = requests.utils.unquote(session.cookies.get("XSRF-TOKEN", ""))
+
+    response = fetch_page(
+        BARCHART_QUOTES_API,
+        session=session,
+        params={
+            "fields": "symbol,contractName,lastPrice,priceChange,percentChange,expirationDate",
+            "list": "futures.contractInRoot",
+            "root": "CT",
+            "raw": "1",
+        },
+        headers={"Accept": "application/json", "X-XSRF-TOKEN": xsrf_token, "Referer": BARCHART_CHAIN_PAGE},
+    )
+
+    exchange_rate = get_usd_to_aud()
+    if exchange_rate is None:
+        raise ValueError("Could not fetch exchange rate for USD to AUD")
+
+    results = parse_cotton_futures_chain(response.json(), exchange_rate, contracts, content_hash(response.content))
     if not results:
         raise ValueError("Could not extract any cotton futures prices from Barchart")
-    
-    # Return all contracts
     return results
 
+
+def parse_cotton_futures_page(content, exchange_rate):
+    """
+    Parse every contract in an archived Barchart quotes response.
+    Args:
+        content (bytes): The JSON response from the quotes endpoint.
+        exchange_rate (float): The USD to AUD exchange rate.
+    Returns:
+        list[dict]: Price data for each contract, cash first.
+    """
+    payload = json.loads(content)
+    return parse_cotton_futures_chain(payload, exchange_rate, len(payload.get("data", [])), content_hash(content))
+
+
+def parse_cotton_futures_chain(payload: dict, exchange_rate: float, contracts: int = COTTON_FUTURES_CONTRACTS,
+                               page_hash: str = None):
+    """
+    Parse a Barchart quotes payload for the cotton root into price records.
+    Args:
+        payload (dict): The JSON response from the quotes endpoint.
+        exchange_rate (float): The USD to AUD exchange rate.
+        contracts (int): Number of deferred futures contracts to keep after cash.
+        page_hash (str, optional): Archive hash of the response the payload came from.
+    Returns:
+        list[dict]: Price data for each contract, cash first.
+    """
+    def number(row, field, raw_scale=1):
+        # Prefer the raw numeric value; fall back to the formatted string (e.g. "65.47s", "+0.18%")
+        raw_value = row.get("raw", {}).get(field)
+        if raw_value is not None:
+            return raw_value * raw_scale
+        value = row.get(field)
+        if isinstance(value, str):
+            match = re.search(r"[+-]?[0-9]+(?:\.[0-9]+)?", value.replace(",", ""))
+            value = float(match.group(0)) if match else None
+        return value
+
+    def expiry(row):
+        # Raw dates are ISO; the formatted ones are MM/DD/YY. Undated contracts sort last
+        for value, parse in ((row.get("raw", {}).get("expirationDate"), datetime.fromisoformat),
+                             (row.get("expirationDate"), lambda v: datetime.strptime(v, "%m/%d/%y"))):
+            if isinstance(value, str):
+                try:
+                    return parse(value)
+                except ValueError:
+                    pass
+        return datetime.max
+
+    cash = None
+    futures = []
+    for row in payload.get("data", []):
+        symbol = row.get("symbol", "")
+        price = number(row, "lastPrice")
+        if not symbol.startswith("CT") or not price:
+            continue
+
+        is_cash = symbol.endswith("Y00")
+        contract_name = "Cotton Cash" if is_cash else f"Cotton {symbol[2:]}"
+        url = "https://www.barchart.com/futures/quotes/cotton" if is_cash else f"https://www.barchart.com/futures/quotes/{symbol}"
+
+        # Use percentage change if available, otherwise calculate from raw change
+        change_percent = number(row, "percentChange", raw_scale=100)  # raw percentages are fractions
+        change_data = number(row, "priceChange")
+        if change_percent is not None:
+            final_change = round(change_percent, 2)
+        elif change_data is not None and price - change_data != 0:
+            final_change = round((change_data / (price - change_data)) * 100, 2)
+        else:
+            final_change = 0.0
+
+        contract = {
+            "commodity": f"Cotton ({contract_name})",
+            # Cotton futures are in US cents per pound, convert to AUD$/bale
+            "price": round(((price * exchange_rate) / 100) * 500, 2),
+            "currency": "AUD",
+            "change": final_change,
+            "unit": "$/bale",
+            "source": url,
+            "timestamp": datetime.now(),
+            "native_price": price,
+            "native_currency": "USD",
+            "native_unit": "c/lb",
+            "fx_rate": exchange_rate,
+            "page_hash": page_hash,
+        }
+        if is_cash:
+            cash = contract
+        else:
+            futures.append((expiry(row), contract))
+
+    # Barchart doesn't promise any order, so take the nearest expiries
+    futures.sort(key=lambda future: future[0])
+    return ([cash] if cash else []) + [contract for _, contract in futures[:contracts]]
+
 def scrape_wheat():
-    url = "https://www.dpi.nsw.gov.au/agriculture/commodity-report"
     headers = {
         "User-Agent": "Mozilla/5.0 (compatible; WheatScraper/1.0)",
         "Accept": "text/html,application/xhtml+xml",
     }
     
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raise error if request fails
-    
-    soup = BeautifulSoup(response.text, "html.parser")
+    response = fetch_page(DPI_REPORT_URL, headers=headers)
+    return parse_wheat(response.content)
+
+def parse_wheat(content, exchange_rate=None):
+    """
+    Parse the wheat price from the NSW DPI commodity report.
+    Args:
+        content (bytes): The page content.
+        exchange_rate (float, optional): Unused; wheat is quoted in AUD.
+    Returns:
+        dict: The price data.
+    """
+    url = DPI_REPORT_URL
+    soup = BeautifulSoup(content, "html.parser")
     
     # Find the wheat section
     wheat_section = soup.find("h2", string="Wheat")
@@ -481,19 +354,33 @@ def scrape_wheat():
         "unit": "$/tonne",
         "source": url,
         "timestamp": datetime.now(),  # Use current date as publication date
+        "native_price": price,
+        "native_currency": "AUD",
+        "native_unit": "$/tonne",
+        "fx_rate": None,
+        "page_hash": content_hash(content),
     }
 
 def scrape_barley():
-    url = "https://www.dpi.nsw.gov.au/agriculture/commodity-report"
     headers = {
         "User-Agent": "Mozilla/5.0 (compatible; BarleyScraper/1.0)",
         "Accept": "text/html,application/xhtml+xml",
     }
     
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raise error if request fails
-    
-    soup = BeautifulSoup(response.text, "html.parser")
+    response = fetch_page(DPI_REPORT_URL, headers=headers)
+    return parse_barley(response.content)
+
+def parse_barley(content, exchange_rate=None):
+    """
+    Parse the barley price from the NSW DPI commodity report.
+    Args:
+        content (bytes): The page content.
+        exchange_rate (float, optional): Unused; barley is quoted in AUD.
+    Returns:
+        dict: The price data.
+    """
+    url = DPI_REPORT_URL
+    soup = BeautifulSoup(content, "html.parser")
     
     # Find the wheat section
     barley_section = soup.find("h2", string="Barley")
@@ -535,21 +422,34 @@ def scrape_barley():
         "unit": "$/tonne",
         "source": url,
         "timestamp": datetime.now(), 
+        "native_price": price,
+        "native_currency": "AUD",
+        "native_unit": "$/tonne",
+        "fx_rate": None,
+        "page_hash": content_hash(content),
     }
 
 def scrape_beef():
-    # url for beef prices
-    url = "https://www.agriculture.gov.au/abares/data/weekly-commodity-price-update"
-    
     headers = {
         "User-Agent": "Mozilla/5.0 (compatible; BeefScraper/1.0)",
         "Accept": "text/html,application/xhtml+xml",
     }
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raise error if request fails
+    response = fetch_page(ABARES_URL, headers=headers)
+    return parse_beef(response.content)
 
-    soup = BeautifulSoup(response.text, "html.parser")
+def parse_beef(content, exchange_rate=None):
+    """
+    Parse the Eastern Young Cattle Indicator from the ABARES weekly price update.
+    Args:
+        content (bytes): The page content.
+        exchange_rate (float, optional): Unused; beef is quoted in AUD.
+    Returns:
+        dict: The price data.
+    """
+    # url for beef prices
+    url = ABARES_URL
+    soup = BeautifulSoup(content, "html.parser")
 
     row = soup.find("td", style="text-align:right;", string="Beef – Eastern Young Cattle Indicator")
 
@@ -573,8 +473,22 @@ def scrape_beef():
         "unit": unit,
         "source": url,
         "timestamp": date,
+        "native_price": price,
+        "native_currency": "AUD",
+        "native_unit": unit,
+        "fx_rate": None,
+        "page_hash": content_hash(content),
     }
 
+# Parsers for each archived page URL, used to re-parse history (see reparse.py).
+# Each takes the page content and the USD to AUD rate recorded with its prices.
+PAGE_PARSERS = {
+    COTLOOK_URL: [parse_cotton],
+    BARCHART_QUOTES_API: [parse_cotton_futures_page],
+    DPI_REPORT_URL: [parse_wheat, parse_barley],
+    ABARES_URL: [parse_beef],
+}
+
 def parse_date(raw_date):
     # Remove 'st', 'nd', 'rd', 'th' from the day part
     cleaned = re.sub(r"(\d+)(st|nd|rd|th)", r"\1", raw_date)
@@ -588,9 +502,7 @@ def store_price(data: dict, db: Session):
         print("Entry for this date already exists.")
         return
 
-    new_entry = Price(**data)
-    db.add(new_entry)
-    db.commit()
+    insert_prices([data])
     print("Stored price in database.")
 
 # Run test
@@ -1,4 +1,14 @@
 import requests
+import numpy as np
+from profiling import span
+
+FX_TIMEOUT = 10  # Seconds to wait for the exchange rate API
+
+
+class ExchangeRateUnavailable(RuntimeError):
+    """
+    Raised when a conversion needs today's exchange rate and it can't be fetched.
+    """
 
 def get_usd_to_aud():
     """
@@ -9,11 +19,75 @@ def get_usd_to_aud():
     url = "https://api.exchangerate-api.com/v4/latest/USD"
     try:
         # Make a GET request to the exchange rate API
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses
+        with span("fx"):
+            response = requests.get(url, timeout=FX_TIMEOUT)
+            response.raise_for_status()  # Raise an error for bad responses
         data = response.json()
         return data['rates']['AUD']  # Return the AUD rate from the response
     except requests.RequestException as e:
         print(f"Error fetching exchange rate: {e}")
         return None
-        
\ No newline at end of file
+        
+
+KG_PER_LB = 0.45359237
+LB_PER_BALE = 500
+
+# Value of one unit expressed in whole currency units per kg
+UNIT_TO_PER_KG = {
+    "$/kg": 1.0,
+    "c/kg": 0.01,
+    "$/tonne": 0.001,
+    "$/lb": 1 / KG_PER_LB,
+    "c/lb": 0.01 / KG_PER_LB,
+    "$/bale": 1 / (LB_PER_BALE * KG_PER_LB),
+}
+SUPPORTED_CURRENCIES = ("AUD", "USD")
+
+
+def convert_prices(prices, units, currencies, fx_rates, unit=None, currency=None, fallback_rate=None):
+    """
+    Convert a whole series of prices into another unit and/or currency in one pass.
+    Args:
+        prices (array-like): Native prices.
+        units (array-like): Native unit of each price (a key of UNIT_TO_PER_KG).
+        currencies (array-like): Native currency of each price ("AUD" or "USD").
+        fx_rates (array-like): USD to AUD rate recorded with each price (None for older rows without one).
+        unit (str, optional): Target unit; keeps each native unit if not given.
+        currency (str, optional): Target currency; keeps each native currency if not given.
+        fallback_rate (Callable, optional): Returns the USD to AUD rate for rows without a
+            recorded rate; only called if such rows need converting.
+    Returns:
+        np.ndarray: The converted prices.
+    Raises:
+        ValueError: If a unit or currency is unsupported.
+        ExchangeRateUnavailable: If rows need a rate and none could be fetched.
+    """
+    prices = np.asarray(prices, dtype=float)
+
+    if unit is not None:
+        if unit not in UNIT_TO_PER_KG:
+            raise ValueError(f"Unsupported unit: {unit}")
+        native_units, index = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+        unknown = [u for u in native_units if u not in UNIT_TO_PER_KG]
+        if unknown:
+            raise ValueError(f"Cannot convert from unit: {', '.join(unknown)}")
+        factors = np.array([UNIT_TO_PER_KG[u] for u in native_units]) / UNIT_TO_PER_KG[unit]
+        prices = prices * factors[index]
+
+    if currency is not None:
+        if currency not in SUPPORTED_CURRENCIES:
+            raise ValueError(f"Unsupported currency: {currency}")
+        rates = np.array(fx_rates, dtype=float)  # None becomes NaN
+        currencies = np.asarray(currencies, dtype=str)
+        to_aud = (currencies == "USD") & (currency == "AUD")
+        to_usd = (currencies == "AUD") & (currency == "USD")
+        missing = np.isnan(rates) & (to_aud | to_usd)
+        if missing.any():
+            rate = fallback_rate() if fallback_rate is not None else None
+            if rate is None:
+                raise ExchangeRateUnavailable("No exchange rate available for currency conversion")
+            rates[missing] = rate
+        prices = np.where(to_aud, prices * rates, prices)
+        prices = np.where(to_usd, prices / rates, prices)
+
+    return prices
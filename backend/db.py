@@ -1,17 +1,142 @@
-from sqlalchemy import create_engine    
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
-from models import Base, Price
+from models import Base, Price, Commodity, Source
+from timeseries import series_store
+from cache import history_cache
+from alerts import alert_engine
 from datetime import datetime
 
 DB_FILE = "sqlite:///./data/prices.db"
 engine =  create_engine(DB_FILE, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# In-process caches of dimension ids; rows are never renamed, so ids never go stale
+_commodity_ids = {}  # (name, unit, currency) -> commodities.id
+_source_ids = {}  # url -> sources.id
+
 # Create tables if they don't exist
 def init_db():
     Base.metadata.create_all(engine)
+    migrate_db()
+
+def migrate_db():
+    """
+    Add any columns that are on the models but missing from existing tables.
+    create_all() only creates new tables, so databases from older versions need this.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"))
+                    print(f"Added column {table.name}.{column.name}.")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+def normalize_prices():
+    """
+    Move the commodity, unit, currency and source strings of an older prices table into
+    the commodities and sources tables, referenced by id, then drop the string columns.
+    Does nothing once the table has been normalized.
+    This drops columns, so only the API runs it (at startup), never the workers; the
+    schema is re-checked under an exclusive lock in case another API process got there first.
+    """
+    legacy = {"commodity", "unit", "currency", "source"}
+    if not legacy & {column["name"] for column in inspect(engine).get_columns("prices")}:
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(prices)")}
+            if not legacy & columns:
+                conn.exec_driver_sql("COMMIT")
+                return
+            conn.execute(text(
+                "INSERT OR IGNORE INTO commodities (name, unit, currency) "
+                "SELECT DISTINCT commodity, COALESCE(unit, ''), COALESCE(currency, 'AUD') "
+                "FROM prices WHERE commodity IS NOT NULL"
+            ))
+            conn.execute(text(
+                "INSERT OR IGNORE INTO sources (url) SELECT DISTINCT source FROM prices WHERE source IS NOT NULL"
+            ))
+            # Rows a worker wrote since the upgrade already have their ids
+            conn.execute(text(
+                "UPDATE prices SET "
+                "commodity_id = (SELECT c.id FROM commodities c WHERE c.name = prices.commodity "
+                "AND c.unit = COALESCE(prices.unit, '') AND c.currency = COALESCE(prices.currency, 'AUD')), "
+                "source_id = (SELECT s.id FROM sources s WHERE s.url = prices.source) "
+                "WHERE commodity_id IS NULL"
+            ))
+            for column in sorted(legacy & columns):
+                conn.exec_driver_sql(f"ALTER TABLE prices DROP COLUMN {column}")
+            conn.exec_driver_sql("COMMIT")
+        except Exception:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
 
-def insert_price(commodity, price, currency, change, unit, source, timestamp):
+        # Reclaim the space the strings took
+        conn.exec_driver_sql("VACUUM")
+    print("Normalized prices into commodities and sources tables.")
+
+def get_commodity_id(name, unit, currency):
+    """
+    Get the id of a commodity, creating it if needed.
+    New commodities are committed straight away so a cached id never outlives a rollback.
+    Args:
+        name (str): The name of the commodity.
+        unit (str): The unit of measurement for its prices.
+        currency (str): The currency of its prices.
+    Returns:
+        int: The commodity id.
+    """
+    unit, currency = unit or "", currency or "AUD"
+    key = (name, unit, currency)
+    if key not in _commodity_ids:
+        with engine.begin() as conn:
+            # INSERT OR IGNORE, so workers racing to create the same commodity don't collide
+            conn.execute(sqlite_insert(Commodity).values(name=name, unit=unit, currency=currency).on_conflict_do_nothing())
+            _commodity_ids[key] = conn.execute(
+                select(Commodity.id).where(Commodity.name == name, Commodity.unit == unit, Commodity.currency == currency)
+            ).scalar()
+    return _commodity_ids[key]
+
+def get_source_id(url):
+    """
+    Get the id of a source URL, creating it if needed.
+    Args:
+        url (str): The source URL.
+    Returns:
+        int: The source id, or None if there is no URL.
+    """
+    if url is None:
+        return None
+    if url not in _source_ids:
+        with engine.begin() as conn:
+            conn.execute(sqlite_insert(Source).values(url=url).on_conflict_do_nothing())
+            _source_ids[url] = conn.execute(select(Source.id).where(Source.url == url)).scalar()
+    return _source_ids[url]
+
+def find_commodity_ids(session, term):
+    """
+    Get the ids of every commodity whose name contains a search term.
+    Args:
+        session (Session): A SQLAlchemy session.
+        term (str): The search term (case-insensitive), matched literally.
+    Returns:
+        list[int]: The matching commodity ids.
+    """
+    # Escape LIKE wildcards so this is a plain substring match, as history_cache invalidation assumes
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return [row.id for row in session.query(Commodity.id).filter(Commodity.name.ilike(f"%{escaped}%", escape="\\"))]
+
+def insert_price(commodity, price, currency, change, unit, source, timestamp,
+                 native_price=None, native_currency=None, native_unit=None, fx_rate=None):
     """
     Insert a new price record into the database.
     Args:
@@ -22,28 +147,76 @@ def insert_price(commodity, price, currency, change, unit, source, timestamp):
         unit (str): The unit of measurement for the price.
         source (str): The source URL for the price data.
         timestamp (datetime or str): The timestamp of the price data.
+        native_price (float, optional): The price as quoted by the source. Defaults to price.
+        native_currency (str, optional): The currency the source quotes in. Defaults to currency.
+        native_unit (str, optional): The unit the source quotes in. Defaults to unit.
+        fx_rate (float, optional): The USD to AUD rate when the price was scraped.
+    """
+    insert_prices([{
+        "commodity": commodity,
+        "price": price,
+        "currency": currency,
+        "change": change,
+        "unit": unit,
+        "source": source,
+        "timestamp": timestamp,
+        "native_price": native_price,
+        "native_currency": native_currency,
+        "native_unit": native_unit,
+        "fx_rate": fx_rate,
+    }])
+
+def insert_prices(records):
+    """
+    Insert a batch of price records into the database in a single transaction.
+    Args:
+        records (list[dict]): Price data as returned by the scrapers, with the same
+            keys as the insert_price() arguments (native_* and fx_rate optional).
+    Raises:
+        Exception: If the batch could not be stored; nothing from it is written.
     """
     session = SessionLocal()
-    try: 
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-
-        new_price = Price(
-            commodity=commodity,
-            price=price,
-            currency=currency,
-            change=change,
-            unit=unit,
-            source=source,
-            timestamp=timestamp
-        )
-
-        session.add(new_price)
-        session.commit()
-        print(f"Inserted price for {commodity} at {timestamp}.")
+    try:
+        new_prices = []
+        for record in records:
+            timestamp = record["timestamp"]
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+
+            new_prices.append(Price(
+                commodity_id=get_commodity_id(record["commodity"], record["unit"], record["currency"]),
+                price=record["price"],
+                change=record["change"],
+                source_id=get_source_id(record["source"]),
+                timestamp=timestamp,
+                native_price=record["price"] if record.get("native_price") is None else record["native_price"],
+                native_currency=record.get("native_currency") or record["currency"],
+                native_unit=record.get("native_unit") or record["unit"],
+                fx_rate=record.get("fx_rate"),
+                page_hash=record.get("page_hash")
+            ))
 
+        inserted = [(r["commodity"], p.price, p.timestamp) for r, p in zip(records, new_prices)]
+        session.add_all(new_prices)
+        session.commit()
     except Exception as e:
         session.rollback()
-        print(f"Error inserting price for {commodity}: {e}")
+        print(f"Error inserting {len(records)} prices: {e}")
+        raise
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+    # The rows are committed now, so failures below must not fail the batch (a retry
+    # would store them twice); a drifted chart store is rebuilt on the next startup
+    for commodity, price, timestamp in inserted:
+        print(f"Inserted price for {commodity} at {timestamp}.")
+        try:
+            # Check alerts against the previous price, keep the chart store in step with the
+            # table, and only then drop cached responses, so nothing cached in between is
+            # built from the store before the append
+            alert_engine.on_price(commodity, price, timestamp)
+            series_store.append(commodity, timestamp, price)
+        except Exception as e:
+            print(f"Error updating derived stores for {commodity}: {e}")
+        finally:
+            history_cache.invalidate(commodity)
@@ -0,0 +1,351 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import requests
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import engine, init_db
+from models import Station, StationReading
+from spatial import STATION_RTREE, mark_stations_changed, sync_rtree
+
+FEED_BATCH_SIZE = 1000  # Rows validated and written per transaction
+CHUNK_SIZE = 64 * 1024  # Characters read at a time from JSON array feeds
+MAX_ELEMENT_SIZE = 16 * CHUNK_SIZE  # Longest JSON array element buffered before it is taken as malformed
+MAX_REPORTED_ERRORS = 10  # Invalid rows printed per ingest; the rest are only counted
+LOCAL_TIMEZONE = ZoneInfo("Australia/Brisbane")  # Readings are stored in local time, like prices
+
+# Bulk station feeds. Each maps the feed's columns (CSV headers or JSON keys) onto stations
+# and metrics; "ranges" bounds plausible values so broken rows are rejected instead of stored.
+# Feed URLs are set per deployment, or a local file is passed to ingest_feed().
+FEEDS = {
+    "water_storage": {
+        "kind": "water",
+        "url": os.getenv("WATER_STORAGE_FEED_URL"),
+        "station": "station_id",
+        "name": "station_name",
+        "latitude": "latitude",
+        "longitude": "longitude",
+        "timestamp": "timestamp",
+        "metrics": {"storage_ml": "volume_ml", "storage_percent": "percent_full", "level_m": "level_m"},
+        "ranges": {"storage_ml": (0, None), "storage_percent": (0, 200)},
+    },
+    "weather": {
+        "kind": "weather",
+        "url": os.getenv("WEATHER_FEED_URL"),
+        "station": "station_id",
+        "name": "station_name",
+        "latitude": "latitude",
+        "longitude": "longitude",
+        "timestamp": "timestamp",
+        "metrics": {"rainfall_mm": "rainfall_mm", "max_temp_c": "max_temp_c", "min_temp_c": "min_temp_c"},
+        "ranges": {"rainfall_mm": (0, 2000), "max_temp_c": (-30, 60), "min_temp_c": (-30, 60)},
+    },
+}
+STATION_KINDS = sorted({feed["kind"] for feed in FEEDS.values()})
+
+
+@contextmanager
+def open_feed(source):
+    """
+    Open a feed file or URL as a binary stream, decompressing gzip transparently.
+    Args:
+        source (str): A local path or an http(s) URL.
+    Yields:
+        io.BufferedReader: The (decompressed) feed content.
+    """
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source, stream=True, timeout=60)
+        response.raise_for_status()
+        response.raw.decode_content = True  # Undo any Content-Encoding; .gz payloads are handled below
+        response.raw.auto_close = False  # gzip reads past the end, which fails once urllib3 has closed it
+        raw = io.BufferedReader(response.raw, CHUNK_SIZE)
+    else:
+        response = None
+        raw = open(source, "rb")
+
+    try:
+        # Go by the gzip magic number rather than the name, so .gz URLs and renamed files both work
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=raw), CHUNK_SIZE) if raw.peek(2)[:2] == b"\x1f\x8b" else raw
+        yield stream
+    finally:
+        raw.close()
+        if response is not None:
+            response.close()
+
+
+def iter_feed_rows(stream):
+    """
+    Parse a feed incrementally, one row at a time.
+    The format is sniffed from the content: a JSON array, JSON lines, or CSV with a header row.
+    Args:
+        stream (io.BufferedReader): The feed content, as from open_feed().
+    Yields:
+        dict: One row, keyed by column name, or a ValueError for a JSON line that could not
+            be decoded, so the caller can count it as invalid and carry on.
+    """
+    first = stream.peek(64).lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if first == b"[":
+        yield from _iter_json_array(text)
+    elif first == b"{":
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"Malformed JSON: {e}")
+    else:
+        yield from csv.DictReader(text)
+
+
+def _iter_json_array(text):
+    """
+    Yield the elements of a top-level JSON array without reading the whole array into memory.
+    An element that can't be decoded is skipped and yielded as a ValueError, like an
+    undecodable JSON line, so one bad element doesn't lose the rest of the feed.
+    Args:
+        text (io.TextIOBase): The JSON text.
+    Yields:
+        The decoded elements, or a ValueError for each malformed one.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = text.read(CHUNK_SIZE).lstrip()[1:], 0, False
+    while True:
+        # Skip the separator before the next element
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            if pos == len(buffer):
+                raise ValueError("Need more data")
+            element, end = decoder.raw_decode(buffer, pos)
+        except ValueError as e:
+            # The element may run past the end of the buffer; read more and try again,
+            # unless it is already too long to be anything but broken
+            if not eof and len(buffer) - pos < MAX_ELEMENT_SIZE:
+                chunk = text.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if pos == len(buffer):
+                yield ValueError("Feed ended inside the JSON array")
+                return
+            buffer, pos = _skip_element(text, buffer, pos)
+            yield ValueError(f"Malformed JSON: {e}")
+            if not buffer:
+                return  # The feed ended inside the malformed element
+            continue
+        pos = end
+        yield element
+
+
+def _skip_element(text, buffer, pos):
+    """
+    Skip a malformed JSON array element, reading on to the comma or bracket that ends it.
+    Args:
+        text (io.TextIOBase): The JSON text, read further as needed.
+        buffer (str): The text read so far.
+        pos (int): Where the element starts in buffer.
+    Returns:
+        tuple[str, int]: The buffer and the position of the separator after the element,
+            or an empty buffer if the feed ended first.
+    """
+    depth, in_string, escaped = 0, False, False
+    while True:
+        for pos in range(pos, len(buffer)):
+            char = buffer[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in ",]" and depth == 0:
+                return buffer, pos
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth = max(depth - 1, 0)
+        # Only the unread text is kept, so a long malformed element isn't held in memory
+        buffer, pos = text.read(CHUNK_SIZE), 0
+        if not buffer:
+            return "", 0
+
+
+def parse_reading_time(raw):
+    """
+    Parse a feed timestamp into naive local time.
+    Args:
+        raw (str): An ISO 8601 date or datetime. Times without an offset are taken as local.
+    Returns:
+        datetime: The timestamp in local time, without tzinfo.
+    """
+    timestamp = datetime.fromisoformat(raw.strip())
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+    return timestamp
+
+
+def validate_row(row, feed):
+    """
+    Check a feed row and pull out its station and readings.
+    Args:
+        row (dict): One row from iter_feed_rows().
+        feed (dict): The feed definition from FEEDS.
+    Returns:
+        tuple[dict, datetime, dict]: The station fields, the reading time, and the readings by metric.
+    Raises:
+        ValueError: If the row is unusable.
+    """
+    if isinstance(row, ValueError):
+        raise row  # A line that failed to decode
+    if not isinstance(row, dict):
+        raise ValueError(f"Expected an object, got {type(row).__name__}")
+    code = str(row.get(feed["station"]) or "").strip()
+    if not code:
+        raise ValueError("Missing station")
+    if not row.get(feed["timestamp"]):
+        raise ValueError("Missing timestamp")
+    timestamp = parse_reading_time(str(row[feed["timestamp"]]))
+
+    station = {"code": code, "name": row.get(feed["name"]) or None, "kind": feed["kind"], "latitude": None, "longitude": None}
+    for field, limit in (("latitude", 90), ("longitude", 180)):
+        raw = row.get(feed[field])
+        if raw not in (None, ""):
+            value = float(raw)
+            if not -limit <= value <= limit:
+                raise ValueError(f"{field} {value} out of range")
+            station[field] = value
+
+    readings = {}
+    for metric, column in feed["metrics"].items():
+        raw = row.get(column)
+        if raw in (None, ""):
+            continue  # Feeds leave gaps where a station doesn't report a metric
+        value = float(raw)
+        low, high = feed["ranges"].get(metric, (None, None))
+        if not math.isfinite(value) or (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError(f"{metric} {value} out of range")
+        readings[metric] = value
+    if not readings:
+        raise ValueError("No readings")
+    return station, timestamp, readings
+
+
+def write_batch(name, stations, readings, station_ids):
+    """
+    Upsert a batch of stations and readings in a single transaction.
+    Args:
+        name (str): The feed the batch is from.
+        stations (dict): Station fields by code, for stations not yet in station_ids.
+        readings (list[tuple[str, str, datetime, float]]): (station code, metric, timestamp, value).
+        station_ids (dict): Station ids by code, filled in with the new stations.
+    """
+    with engine.begin() as conn:
+        if stations:
+            stmt = sqlite_insert(Station)
+            conn.execute(stmt.on_conflict_do_update(index_elements=["feed", "code"], set_={
+                "name": stmt.excluded.name,
+                "kind": stmt.excluded.kind,
+                "latitude": stmt.excluded.latitude,
+                "longitude": stmt.excluded.longitude,
+            }), [{**station, "feed": name} for station in stations.values()])
+            new_ids = dict(conn.execute(
+                select(Station.code, Station.id).where(Station.feed == name, Station.code.in_(list(stations)))
+            ).all())
+            station_ids.update(new_ids)
+            if STATION_RTREE:
+                sync_rtree(conn, list(new_ids.values()))
+
+        if readings:
+            stmt = sqlite_insert(StationReading)
+            conn.execute(
+                stmt.on_conflict_do_update(index_elements=["station_id", "metric", "timestamp"],
+                                           set_={"value": stmt.excluded.value}),
+                [{"station_id": station_ids[code], "metric": metric, "timestamp": timestamp, "value": value}
+                 for code, metric, timestamp, value in readings],
+            )
+
+
+def ingest_feed(name, source=None, batch_size=FEED_BATCH_SIZE):
+    """
+    Stream a bulk station feed into the stations and station_readings tables.
+    Rows are parsed one at a time and written in batches, so memory use doesn't grow with the feed.
+    Args:
+        name (str): The feed name in FEEDS (e.g. "water_storage", "weather").
+        source (str, optional): A local file or URL to read instead of the feed's configured URL.
+        batch_size (int): Rows per write transaction.
+    Returns:
+        dict: Counts of rows read, invalid rows, readings written and stations seen.
+    Raises:
+        ValueError: If the feed is unknown or has no source.
+    """
+    if name not in FEEDS:
+        raise ValueError(f"Unknown feed: {name}")
+    feed = FEEDS[name]
+    source = source or feed["url"]
+    if not source:
+        raise ValueError(f"No source configured for feed: {name}")
+
+    started = time.perf_counter()
+    stats = {"rows": 0, "invalid": 0, "readings": 0, "stations": 0}
+    station_ids, stations, readings = {}, {}, []
+    if STATION_RTREE:
+        # Creates and backfills the R*Tree the first time, so bbox queries only ever read it
+        with engine.begin() as conn:
+            sync_rtree(conn, [])
+
+    def flush():
+        write_batch(name, stations, readings, station_ids)
+        if stations:
+            mark_stations_changed()
+        stats["readings"] += len(readings)
+        stations.clear()
+        readings.clear()
+
+    with open_feed(source) as stream:
+        for row in iter_feed_rows(stream):
+            stats["rows"] += 1
+            try:
+                station, timestamp, values = validate_row(row, feed)
+            except (ValueError, TypeError) as e:
+                stats["invalid"] += 1
+                if stats["invalid"] <= MAX_REPORTED_ERRORS:
+                    print(f"Skipping {name} row {stats['rows']}: {e}")
+                continue
+
+            # Each station's details are written once per ingest, from the first row that names it
+            if station["code"] not in station_ids and station["code"] not in stations:
+                stations[station["code"]] = station
+            readings += [(station["code"], metric, timestamp, value) for metric, value in values.items()]
+            if stats["rows"] % batch_size == 0:
+                flush()
+    flush()
+
+    stats["stations"] = len(station_ids)
+    print(f"Ingested {stats['readings']} reading(s) from {stats['stations']} station(s) in {name} "
+          f"({stats['invalid']} invalid row(s) skipped) in {time.perf_counter() - started:.1f}s.")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a bulk water storage or weather station feed.")
+    parser.add_argument("feed", choices=sorted(FEEDS), help="the feed to ingest")
+    parser.add_argument("--source", help="a local file or URL to read instead of the configured feed URL (.gz is fine)")
+    parser.add_argument("--batch-size", type=int, default=FEED_BATCH_SIZE, help="rows per write transaction")
+    args = parser.parse_args()
+
+    init_db()
+    ingest_feed(args.feed, args.source, args.batch_size)
@@ -1,40 +1,128 @@
+import json
+import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from pathlib import Path
-from commodity_scraper import scrape_commodity
-from db import insert_price
+from archive import collect_pages, record_pages
+from commodity_scraper import scrape_commodity, scrape_cotton_futures_all
+from currency import get_usd_to_aud
+from db import insert_prices
+from profiling import record_spans, save_scrape_profile
 
 
-PRICE_FILE = Path("prices.json")
+PRICE_FILE = Path("./data/prices.json")  # Latest prices, shared by the API and the workers
+
+def scrape_prices(commodity: str):
+    """
+    Scrape the latest prices for a commodity without storing them.
+    This is the parse-heavy part of a scrape job, so workers run it in a separate process.
+    Args:
+        commodity (str): The name of the commodity to fetch (e.g., "cotton_futures", "wheat", "barley").
+    Returns:
+        list[dict]: Price data with ISO timestamps (one entry per contract for cotton futures).
+    Raises:
+        ValueError: If no data was found.
+    """
+    if commodity == "cotton_futures":
+        records = scrape_cotton_futures_all()
+    else:
+        records = [scrape_commodity(commodity)]
+
+    if not records or not all(records):
+        raise ValueError(f"No data found for commodity: {commodity}")
+
+    # Record the day's USD to AUD rate on AUD-quoted prices too, so converting them
+    # later uses the rate from when they were scraped rather than today's
+    if any(record.get("fx_rate") is None for record in records):
+        exchange_rate = get_usd_to_aud()
+        for record in records:
+            if record.get("fx_rate") is None:
+                record["fx_rate"] = exchange_rate
+
+    # Add timestamp to the data
+    timestamp = datetime.now(ZoneInfo("Australia/Brisbane")).isoformat()
+    for record in records:
+        record["timestamp"] = timestamp
+    return records
+
+def scrape_prices_timed(commodity: str):
+    """
+    Scrape the latest prices for a commodity, timing each stage of the scrape.
+    The fetched pages are archived but not recorded, since this runs in scrape processes
+    that must not use the database; the caller records them with record_pages().
+    Args:
+        commodity (str): The name of the commodity to fetch.
+    Returns:
+        tuple[list[dict], dict, str, list[dict]]: The price data (empty on failure), seconds spent
+            per stage ("fetch", "archive", "fx", "parse"), the error message if the scrape failed,
+            and the pages archived along the way (kept even on failure, for re-parsing).
+    """
+    started = time.perf_counter()
+    records, error = [], None
+    with record_spans() as stages, collect_pages() as pages:
+        try:
+            records = scrape_prices(commodity)
+        except Exception as e:
+            error = str(e)
+    # Whatever wasn't spent waiting on the network or archiving went on parsing
+    waited = sum(stages.get(stage, 0.0) for stage in ("fetch", "archive", "fx"))
+    stages["parse"] = max(time.perf_counter() - started - waited, 0.0)
+    return records, dict(stages), error, list(pages)
+
+def ingest_prices(records):
+    """
+    Store a batch of scraped prices in the database and the latest prices file.
+    Args:
+        records (list[dict]): Price data as returned by scrape_prices().
+    Returns:
+        float: Seconds spent writing to the database.
+    Raises:
+        Exception: If the database write failed; the latest prices file is left as it was.
+    """
+    started = time.perf_counter()
+    insert_prices(records)
+    db_write = time.perf_counter() - started
+    update_price_file(records)
+    return db_write
+
+def update_price_file(records):
+    """
+    Replace the entries for the given commodities in the latest prices file.
+    Args:
+        records (list[dict]): Price data with ISO timestamps.
+    """
+    latest = []
+    if PRICE_FILE.exists():
+        with open(PRICE_FILE, "r") as f:
+            latest = json.load(f)
+
+    names = {record["commodity"] for record in records}
+    latest = [entry for entry in latest if entry["commodity"] not in names] + list(records)
+
+    # Write to a temporary file first so readers never see a partial file
+    PRICE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = PRICE_FILE.with_suffix(".json.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(latest, f, indent=4, default=str)
+    tmp_file.replace(PRICE_FILE)
 
 def fetch_prices(commodity: str):
-    """    
+    """
     Fetch the latest price for a given commodity and store it in the database.
     Args:
         commodity (str): The name of the commodity to fetch (e.g., "cotton", "wheat", "barley").
     """
+    records, stages, error, pages = scrape_prices_timed(commodity)
     try:
-        data =  scrape_commodity(commodity)
-        
-        if not data:
-            raise ValueError(f"No data found for commodity: {commodity}")
-            return
-
-        # Add timestamp to the data
-        data["timestamp"] = datetime.now(ZoneInfo("Australia/Brisbane")).isoformat()
-
-        insert_price(
-            commodity=data["commodity"],
-            price=data["price"],
-            change=data["change"],
-            currency=data["currency"],
-            unit=data["unit"],
-            source=data["source"],
-            timestamp=data["timestamp"]
-        )
-
-        print(f"Successfully fetched and stored price for {data['commodity']}.")
-
+        record_pages(pages)
     except Exception as e:
-        print(f"Error fetching price for {commodity}: {e}")
-
+        print(f"Error recording archived pages for {commodity}: {e}")
+    if not error:
+        try:
+            stages["db_write"] = ingest_prices(records)
+            print(f"Successfully fetched and stored {len(records)} price(s) for {commodity}.")
+        except Exception as e:
+            error = f"Error storing prices: {e}"
+    if error:
+        print(f"Error fetching price for {commodity}: {error}")
+    save_scrape_profile(commodity, stages, error)
@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import case, text
+from db import engine, SessionLocal
+from models import ScrapeJob
+
+MAX_ATTEMPTS = 3
+JOB_TIMEOUT = timedelta(minutes=10)  # Running jobs older than this are assumed lost
+MIN_REFRESH_INTERVAL = timedelta(minutes=5)  # Don't re-scrape a source more often than this on demand
+
+_enqueue_lock = threading.Lock()
+
+
+def enqueue_job(commodity: str, min_interval: timedelta = None):
+    """
+    Queue a scrape job for a commodity, coalescing onto a job that is already in flight.
+    Running jobs past JOB_TIMEOUT are requeued or failed first rather than coalesced onto.
+    Args:
+        commodity (str): The commodity key to scrape (e.g. "wheat", "cotton_futures").
+        min_interval (timedelta, optional): If a job for the commodity finished within
+            this interval, return it instead of queueing a new one.
+    Returns:
+        int: The id of the new or existing job.
+    """
+    # Check-then-insert under a lock so concurrent callers share one job
+    with _enqueue_lock:
+        requeue_stale_jobs()
+        session = SessionLocal()
+        try:
+            existing = session.query(ScrapeJob)\
+                .filter(ScrapeJob.commodity == commodity, ScrapeJob.status.in_(["queued", "running"]))\
+                .first()
+            if existing:
+                return existing.id
+
+            if min_interval is not None:
+                recent = session.query(ScrapeJob)\
+                    .filter(ScrapeJob.commodity == commodity, ScrapeJob.status == "done",
+                            ScrapeJob.finished_at >= datetime.now() - min_interval)\
+                    .order_by(ScrapeJob.finished_at.desc())\
+                    .first()
+                if recent:
+                    return recent.id
+
+            job = ScrapeJob(commodity=commodity, status="queued", attempts=0, created_at=datetime.now())
+            session.add(job)
+            session.commit()
+            return job.id
+        finally:
+            session.close()
+
+
+def get_job(job_id: int):
+    """
+    Get the current state of a job.
+    Args:
+        job_id (int): The job id.
+    Returns:
+        dict or None: The job, or None if it doesn't exist.
+    """
+    session = SessionLocal()
+    try:
+        job = session.get(ScrapeJob, job_id)
+        if job is None:
+            return None
+        return {
+            "id": job.id,
+            "commodity": job.commodity,
+            "status": job.status,
+            "attempts": job.attempts,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+    finally:
+        session.close()
+
+
+def claim_jobs(limit: int):
+    """
+    Atomically claim up to `limit` queued jobs for this worker.
+    Args:
+        limit (int): The maximum number of jobs to claim.
+    Returns:
+        list[tuple[int, str]]: The claimed (job id, commodity) pairs.
+    """
+    # A single UPDATE ... RETURNING keeps two workers from claiming the same job
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "UPDATE scrape_jobs SET status = 'running', started_at = :now, attempts = attempts + 1 "
+            "WHERE id IN (SELECT id FROM scrape_jobs WHERE status = 'queued' ORDER BY id LIMIT :limit) "
+            "RETURNING id, commodity"
+        ), {"now": datetime.now(), "limit": limit}).all()
+    return [(row.id, row.commodity) for row in rows]
+
+
+def finish_job(job_id: int, error: str = None):
+    """
+    Mark a job as done, or record its error and requeue it until it runs out of attempts.
+    Args:
+        job_id (int): The job id.
+        error (str, optional): The error the job failed with.
+    """
+    session = SessionLocal()
+    try:
+        job = session.get(ScrapeJob, job_id)
+        if job is None:
+            return
+        if error is None:
+            job.status = "done"
+        else:
+            job.error = error
+            job.status = "queued" if job.attempts < MAX_ATTEMPTS else "failed"
+        if job.status != "queued":
+            job.finished_at = datetime.now()
+        session.commit()
+    finally:
+        session.close()
+
+
+def requeue_stale_jobs():
+    """
+    Put jobs back on the queue that have been running longer than JOB_TIMEOUT, because
+    their worker died or hung; jobs out of attempts are failed instead.
+    Returns:
+        int: The number of jobs requeued or failed.
+    """
+    now = datetime.now()
+    out_of_attempts = ScrapeJob.attempts >= MAX_ATTEMPTS
+    session = SessionLocal()
+    try:
+        count = session.query(ScrapeJob)\
+            .filter(ScrapeJob.status == "running", ScrapeJob.started_at < now - JOB_TIMEOUT)\
+            .update({
+                ScrapeJob.status: case((out_of_attempts, "failed"), else_="queued"),
+                ScrapeJob.error: "Timed out",
+                ScrapeJob.finished_at: case((out_of_attempts, now), else_=None),
+            }, synchronize_session=False)
+        session.commit()
+        return count
+    finally:
+        session.close()
@@ -1,20 +1,29 @@
 
+import asyncio
 import json
 from contextlib import asynccontextmanager
-from pathlib import Path
-from fetcher import fetch_prices
-from commodity_scraper import scrape_commodity
+from fetcher import PRICE_FILE
+from jobs import enqueue_job, get_job, MIN_REFRESH_INTERVAL
 from datetime import datetime
-from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session
-from db import SessionLocal
-from models import Price
+from db import SessionLocal, init_db, normalize_prices, find_commodity_ids
+from models import Price, AlertSubscription
+from timeseries import series_store, micros_to_iso
+from cache import history_cache
+from alerts import ALERT_KINDS, ALERT_CHANNELS, check_webhook_target, mark_alerts_changed
+from profiling import SamplingProfiler, check_token, load_scrape_profiles, profiling_request, sample_request_thread
+from feeds import STATION_KINDS
+from spatial import station_index
+from currency import get_usd_to_aud, convert_prices, ExchangeRateUnavailable, SUPPORTED_CURRENCIES, UNIT_TO_PER_KG
 from fastapi import Depends
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
 
-PRICE_FILE = Path("prices.json")
 SUPPORTED_COMMODITIES = ["cotlook_A_index", "cotton_futures", "wheat", "barley", "beef"]
+MAX_NEARBY_STATIONS = 100
 
 
 def get_db():
@@ -32,41 +41,47 @@ def get_db():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Lifespan context manager to initialize the app and fetch initial prices.
+    Lifespan context manager to initialize the app and queue a fetch of initial prices.
     This runs once when the app starts up.
     Args:   
         app (FastAPI): The FastAPI application instance.        
         Yields:
             None: The app is running.
     """
-    all_prices = []
+    init_db()
+    # The one-off prices migration drops columns, so it runs here rather than in every init_db()
+    normalize_prices()
+
+    # Rebuild the columnar chart store from the DB if it's missing (e.g. fresh volume)
+    # or no longer holds the same rows as the table
+    db = SessionLocal()
+    try:
+        if series_store.is_stale(db):
+            series_store.rebuild(db)
+            history_cache.clear()
+    except Exception as e:
+        print(f"Error rebuilding price series: {e}")
+    finally:
+        db.close()
+
+    # Queue a refresh of every source; the scrape workers pick these up
     for commodity in SUPPORTED_COMMODITIES:
-        # Fetch prices from the API and scrape data
-        try:
-            fetch_prices(commodity)
-            
-            # Special handling for cotton futures to get all contracts
-            if commodity == "cotton_futures":
-                from commodity_scraper import scrape_cotton_futures_all
-                contracts = scrape_cotton_futures_all()
-                for contract in contracts:
-                    contract["timestamp"] = datetime.now(ZoneInfo("Australia/Brisbane")).isoformat()
-                    all_prices.append(contract)
-            else:
-                data = scrape_commodity(commodity)
-                data["timestamp"] = datetime.now(ZoneInfo("Australia/Brisbane")).isoformat()
-                all_prices.append(data)
-        # Handle any errors during fetching or scraping
-        except Exception as e:
-            print(f"Error during startup fetch for {commodity}: {e}")
-    # Write all prices to the JSON file
-    with open(PRICE_FILE, "w") as f:
-        json.dump(all_prices, f, indent=4)
+        job_id = enqueue_job(commodity)
+        print(f"Queued startup scrape for {commodity} (job {job_id}).")
 
     yield  # app runs here
 
+class ProfiledRoute(APIRoute):
+    """
+    Route whose endpoint registers its thread with the request's profiler, if any.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, sample_request_thread(endpoint), **kwargs)
+
 # Enable CORS
 app = FastAPI(lifespan=lifespan)
+app.router.route_class = ProfiledRoute
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -75,6 +90,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Return a sampling profile instead of the response when a valid profiling token is sent.
+    The token goes in the X-Profile-Token header or the ?profile= query parameter.
+    Args:
+        request (Request): The incoming request.
+        call_next (Callable): The rest of the app.
+    Returns:
+        Response: The normal response, or the profile as plain text.
+    """
+    token = request.headers.get("X-Profile-Token") or request.query_params.get("profile")
+    if not token or request.url.path.startswith("/profiles") or not check_token(token):
+        return await call_next(request)
+
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        with profiling_request(profiler):
+            response = await call_next(request)
+            async for _ in response.body_iterator:  # Make sure the whole response was produced
+                pass
+    finally:
+        profiler.stop()
+    return PlainTextResponse(
+        f"{request.method} {request.url.path} -> {response.status_code}\n{profiler.report()}",
+        headers={"X-Profiled-Status": str(response.status_code)},
+    )
+
 @app.get("/")
 # Root endpoint
 def root():
@@ -93,32 +137,336 @@ def get_prices():
 def get_api_prices():
     return get_prices()
 
+def cached_json(commodity, key, loader, cacheable=None):
+    """
+    Serve a JSON response from the history cache, loading and caching it on a miss.
+    Args:
+        commodity (str): The commodity search term from the request.
+        key (tuple): The rest of the request (endpoint, range, options).
+        loader (Callable): Builds the response data on a cache miss.
+        cacheable (Callable, optional): Called after loading; a false result keeps the
+            response out of the cache (e.g. when it depends on something other than the DB).
+    Returns:
+        Response: The JSON response.
+    """
+    history_cache.sync()  # Pick up writes made by the scrape workers
+    body = history_cache.get(commodity, key)
+    if body is None:
+        generation = history_cache.generation
+        body = json.dumps(loader()).encode()
+        if cacheable is None or cacheable():
+            history_cache.put(commodity, key, body, generation)
+    return Response(content=body, media_type="application/json")
+
+def parse_time_param(name, value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 timestamp")
+
 # Add route for historical data
 @app.get("/history/{commodity}")
-def get_historical_prices(commodity: str, db: Session = Depends(get_db)):
+def get_historical_prices(commodity: str, start: str = None, end: str = None,
+                          currency: str = None, unit: str = None, db: Session = Depends(get_db)):
     """
     Get historical prices for a specific commodity.
     Args:
         commodity (str): The commodity to fetch historical prices for.
-       db (Session): The database session.
+        start (str, optional): Earliest ISO timestamp to include.
+        end (str, optional): Latest ISO timestamp to include.
+        currency (str, optional): Convert prices into this currency ("AUD" or "USD").
+        unit (str, optional): Convert prices into this unit (e.g. "c/lb", "$/tonne").
+        db (Session): The database session.
     Returns:
         List[Price]: A list of historical prices for the commodity.
     """
-    results = db.query(Price)\
-        .filter(Price.commodity.ilike(f"%{commodity}%"))\
-        .order_by(Price.timestamp.desc())\
-        .all()
-    
-    # Convert SQLAlchemy results to dictionaries
-    return [
-        {
-            "commodity": r.commodity,
-            "price": r.price,
-            "currency": r.currency,
-            "change": r.change,
-            "unit": r.unit,
-            "source": r.source,
-            "timestamp": r.timestamp.isoformat(),
-            
-        } for r in results
-    ]
\ No newline at end of file
+    currency = currency.upper() if currency else None
+    if currency and currency not in SUPPORTED_CURRENCIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported currency: {currency}")
+    if unit and unit not in UNIT_TO_PER_KG:
+        raise HTTPException(status_code=400, detail=f"Unsupported unit: {unit}")
+    start_time, end_time = parse_time_param("start", start), parse_time_param("end", end)
+    used_live_rate = []
+
+    def live_rate():
+        # Older rows have no recorded rate; today's rate isn't tied to any write, so
+        # responses that needed it are not cached
+        used_live_rate.append(True)
+        return get_usd_to_aud()
+
+    def load():
+        query = db.query(Price).filter(Price.commodity_id.in_(find_commodity_ids(db, commodity)))
+        if start_time:
+            query = query.filter(Price.timestamp >= start_time)
+        if end_time:
+            query = query.filter(Price.timestamp <= end_time)
+        results = query.order_by(Price.timestamp.desc()).all()
+
+        rows = [
+            {
+                "commodity": r.commodity,
+                "price": r.price,
+                "currency": r.currency,
+                "change": r.change,
+                "unit": r.unit,
+                "source": r.source,
+                "timestamp": r.timestamp.isoformat(),
+                "native_price": r.native_price,
+                "native_currency": r.native_currency,
+                "native_unit": r.native_unit,
+                "fx_rate": r.fx_rate,
+            } for r in results
+        ]
+        if not rows or not (currency or unit):
+            return rows
+
+        # Convert the whole series from each row's native quote (older rows only have the stored value)
+        base = [
+            (row["native_price"], row["native_unit"], row["native_currency"]) if row["native_price"] is not None
+            else (row["price"], row["unit"], row["currency"]) for row in rows
+        ]
+        base_prices, base_units, base_currencies = zip(*base)
+        try:
+            prices = convert_prices(
+                base_prices, base_units, base_currencies, [row["fx_rate"] for row in rows],
+                unit=unit, currency=currency, fallback_rate=live_rate,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ExchangeRateUnavailable as e:
+            # The exchange rate API is down; the request itself was fine
+            raise HTTPException(status_code=503, detail=str(e))
+
+        for row, price, base_unit, base_currency in zip(rows, prices.round(4).tolist(), base_units, base_currencies):
+            row.update(price=price, unit=unit or base_unit, currency=currency or base_currency)
+        return rows
+
+    return cached_json(commodity, ("history", start, end, currency, unit), load,
+                       cacheable=lambda: not used_live_rate)
+
+@app.get("/history/{commodity}/series")
+def get_historical_series(commodity: str, start: str = None, end: str = None):
+    """
+    Get historical prices for charting, served from the columnar store without touching the DB.
+    Args:
+        commodity (str): The commodity to fetch historical prices for.
+        start (str, optional): Earliest ISO timestamp to include.
+        end (str, optional): Latest ISO timestamp to include.
+    Returns:
+        List[dict]: One series per matching commodity, with parallel timestamp and price lists.
+    """
+    start_time, end_time = parse_time_param("start", start), parse_time_param("end", end)
+
+    def load():
+        series = []
+        for name in series_store.commodities():
+            if commodity.lower() not in name.lower():
+                continue
+            timestamps, prices = series_store.range(name, start_time, end_time)
+            series.append({
+                "commodity": name,
+                "timestamps": micros_to_iso(timestamps),
+                "prices": prices.tolist(),
+            })
+        return series
+
+    return cached_json(commodity, ("series", start, end), load)
+
+
+class AlertRequest(BaseModel):
+    """
+    Request body for creating a price alert.
+    Attributes:
+        commodity (str): Commodity search term (e.g. "Cotton Z26").
+        kind (str): "above", "below" or "move".
+        threshold (float): Price level in the stored unit, or percentage for "move".
+        window_days (int): Look-back window for "move" alerts.
+        channel (str): "webhook" or "email".
+        target (str): Webhook URL or email address.
+    """
+    commodity: str
+    kind: str
+    threshold: float
+    window_days: int = 7
+    channel: str = "webhook"
+    target: str
+
+def alert_to_dict(subscription):
+    return {
+        "id": subscription.id,
+        "commodity": subscription.commodity,
+        "kind": subscription.kind,
+        "threshold": subscription.threshold,
+        "window_days": subscription.window_days,
+        "channel": subscription.channel,
+        "target": subscription.target,
+        "created_at": subscription.created_at.isoformat(),
+    }
+
+@app.post("/alerts")
+def create_alert(request: AlertRequest, db: Session = Depends(get_db)):
+    """
+    Subscribe to a price alert.
+    Args:
+        request (AlertRequest): The alert to create.
+        db (Session): The database session.
+    Returns:
+        dict: The created subscription.
+    """
+    if request.kind not in ALERT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported alert kind: {request.kind}")
+    if request.channel not in ALERT_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"Unsupported alert channel: {request.channel}")
+    if request.channel == "webhook":
+        try:
+            check_webhook_target(request.target)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    subscription = AlertSubscription(**request.model_dump(), created_at=datetime.now())
+    db.add(subscription)
+    db.commit()
+    mark_alerts_changed()
+    return alert_to_dict(subscription)
+
+@app.get("/alerts")
+def get_alerts(db: Session = Depends(get_db)):
+    """
+    List every price alert subscription.
+    Args:
+        db (Session): The database session.
+    Returns:
+        List[dict]: The subscriptions.
+    """
+    return [alert_to_dict(s) for s in db.query(AlertSubscription).all()]
+
+@app.delete("/alerts/{alert_id}")
+def delete_alert(alert_id: int, db: Session = Depends(get_db)):
+    """
+    Remove a price alert subscription.
+    Args:
+        alert_id (int): The subscription id.
+        db (Session): The database session.
+    Returns:
+        dict: Confirmation message.
+    """
+    subscription = db.get(AlertSubscription, alert_id)
+    if subscription is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    db.delete(subscription)
+    db.commit()
+    mark_alerts_changed()
+    return {"message": f"Deleted alert {alert_id}"}
+
+def check_station_kind(kind):
+    if kind is not None and kind not in STATION_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported station kind: {kind}")
+
+@app.get("/stations/nearby")
+def get_nearby_stations(lat: float, lon: float, k: int = 5, kind: str = None):
+    """
+    Get the stations nearest to a point (e.g. a farm), served from the in-memory spatial index.
+    Args:
+        lat (float): Latitude in decimal degrees.
+        lon (float): Longitude in decimal degrees.
+        k (int): How many stations to return (at most MAX_NEARBY_STATIONS).
+        kind (str, optional): Only "water" or "weather" stations.
+    Returns:
+        List[dict]: The stations, nearest first, with their distance in km.
+    """
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Latitude must be within ±90 and longitude within ±180")
+    if not 1 <= k <= MAX_NEARBY_STATIONS:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_NEARBY_STATIONS}")
+    check_station_kind(kind)
+    return station_index.nearest(lat, lon, k, kind)
+
+@app.get("/stations/bbox")
+def get_stations_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, kind: str = None):
+    """
+    Get the stations inside a bounding box (e.g. around a catchment).
+    Args:
+        min_lat (float): Southern edge.
+        min_lon (float): Western edge; greater than max_lon for boxes crossing the antimeridian.
+        max_lat (float): Northern edge.
+        max_lon (float): Eastern edge.
+        kind (str, optional): Only "water" or "weather" stations.
+    Returns:
+        List[dict]: The stations, south to north.
+    """
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    check_station_kind(kind)
+    return station_index.within(min_lat, min_lon, max_lat, max_lon, kind)
+
+@app.post("/refresh")
+def refresh_prices(commodity: str = None):
+    """
+    Trigger an on-demand refresh of one or all sources.
+    Calls for a source that is already being refreshed, or was refreshed within the
+    minimum interval, get that job back instead of starting another scrape.
+    Args:
+        commodity (str, optional): The commodity key to refresh; all sources if not given.
+    Returns:
+        dict: The job for each source.
+    """
+    if commodity is not None and commodity not in SUPPORTED_COMMODITIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported commodity: {commodity}")
+
+    commodities = [commodity] if commodity else SUPPORTED_COMMODITIES
+    return {"jobs": [get_job(enqueue_job(c, min_interval=MIN_REFRESH_INTERVAL)) for c in commodities]}
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: int):
+    """
+    Get the status of a refresh job.
+    Args:
+        job_id (int): The job id.
+    Returns:
+        dict: The job.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job_status(job_id: int):
+    """
+    Stream a refresh job's status as server-sent events until it finishes.
+    Args:
+        job_id (int): The job id.
+    Returns:
+        StreamingResponse: An event stream with one event per status change.
+    """
+    if get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/profiles/scrapes")
+def get_scrape_profiles(request: Request):
+    """
+    Get the per-stage timings of the most recent scrape cycles.
+    Requires the profiling token in the X-Profile-Token header.
+    Args:
+        request (Request): The incoming request.
+    Returns:
+        List[dict]: The recorded cycles, newest first.
+    """
+    if not check_token(request.headers.get("X-Profile-Token")):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return list(reversed(load_scrape_profiles()))
@@ -1,35 +1,214 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
 
+class Commodity(Base):
+    """
+    Represents a commodity that prices are recorded for.
+    Attributes:
+        id (int): Unique identifier for the commodity.
+        name (str): Name of the commodity (e.g. "Cotton (Cotton Z26)").
+        unit (str): Unit of measurement for stored prices.
+        currency (str): Currency of stored prices.
+    """
+    __tablename__ = "commodities"
+    __table_args__ = (UniqueConstraint("name", "unit", "currency"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    # NOT NULL so the unique constraint holds (SQLite treats NULLs as distinct); "" is no unit
+    name = Column(String, nullable=False)
+    unit = Column(String, nullable=False, default="")
+    currency = Column(String, nullable=False, default="AUD")  # Default currency is AUD
+
+
+class Source(Base):
+    """
+    Represents a URL that prices are scraped from.
+    Attributes:
+        id (int): Unique identifier for the source.
+        url (str): Source URL for the price data.
+    """
+    __tablename__ = "sources"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False, unique=True)
+
+
 class Price(Base):
     """
     Represents a commodity price record in the database.
+    The commodity (with its unit and currency) and the source URL are stored once in
+    their own tables and referenced by id; the properties below read them back.
     Attributes:
         id (int): Unique identifier for the price record.
-        commodity (str): Name of the commodity.
+        commodity_id (int): The commodity the price is for.
         price (float): Price of the commodity.
         change (float): Change in price.
-        unit (str): Unit of measurement for the price.
         timestamp (datetime): Timestamp when the price was recorded.
-        source (str): Source URL for the price data.
+        source_id (int): The source the price was scraped from.
+        native_price (float): Price as quoted by the source, before any conversion.
+        native_currency (str): Currency the source quotes in.
+        native_unit (str): Unit the source quotes in.
+        fx_rate (float): USD to AUD rate when the price was scraped (applied to get the stored price for USD quotes).
+        page_hash (str): Archive hash of the page the price was parsed from.
     """
     __tablename__ = "prices"
+    __table_args__ = (Index("ix_prices_commodity_id_timestamp", "commodity_id", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    commodity = Column(String)
+    commodity_id = Column(Integer, ForeignKey("commodities.id"))
     price = Column(Float)
-    currency = Column(String, default="AUD")  # Default currency is AUD
     change = Column(Float)
-    unit = Column(String)
     timestamp = Column(DateTime)
-    source = Column(String)
+    source_id = Column(Integer, ForeignKey("sources.id"))
+    native_price = Column(Float)
+    native_currency = Column(String)
+    native_unit = Column(String)
+    fx_rate = Column(Float)
+    page_hash = Column(String, index=True)
+
+    commodity_info = relationship(Commodity, lazy="joined")
+    source_info = relationship(Source, lazy="joined")
+
+    @property
+    def commodity(self):
+        return self.commodity_info.name
+
+    @property
+    def unit(self):
+        return self.commodity_info.unit
 
-def __repr__(self):
+    @property
+    def currency(self):
+        return self.commodity_info.currency
+
+    @property
+    def source(self):
+        return self.source_info.url if self.source_info else None
+
+    def __repr__(self):
         return (
             f"<Price(commodity={self.commodity}, price={self.price}, "
             f"change={self.change}, unit={self.unit}, "
             f"timestamp={self.timestamp}, source={self.source})>"
-        )
\ No newline at end of file
+        )
+
+class AlertSubscription(Base):
+    """
+    Represents a user's price alert subscription.
+    Attributes:
+        id (int): Unique identifier for the subscription.
+        commodity (str): Commodity search term (e.g. "Cotton Z26"), matched like /history.
+        kind (str): "above", "below" or "move".
+        threshold (float): Price level for "above"/"below", or percentage for "move".
+        window_days (int): Look-back window for "move" alerts (e.g. 7 for week-on-week).
+        channel (str): "webhook" or "email".
+        target (str): Webhook URL or email address.
+        created_at (datetime): When the subscription was created.
+    """
+    __tablename__ = "alert_subscriptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    commodity = Column(String)
+    kind = Column(String)
+    threshold = Column(Float)
+    window_days = Column(Integer)
+    channel = Column(String)
+    target = Column(String)
+    created_at = Column(DateTime)
+
+
+class ScrapeJob(Base):
+    """
+    Represents a scrape job on the local job queue.
+    Attributes:
+        id (int): Unique identifier for the job.
+        commodity (str): The commodity key to scrape (e.g. "wheat", "cotton_futures").
+        status (str): "queued", "running", "done" or "failed".
+        attempts (int): How many times a worker has picked the job up.
+        error (str): The last error, if any.
+        created_at (datetime): When the job was queued.
+        started_at (datetime): When a worker last picked the job up.
+        finished_at (datetime): When the job finished.
+    """
+    __tablename__ = "scrape_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    commodity = Column(String)
+    status = Column(String, default="queued", index=True)
+    attempts = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class ArchivedPage(Base):
+    """
+    Represents one fetch of a page stored in the raw page archive.
+    The content itself lives in the archive directory, keyed by its hash, so
+    unchanged pages fetched on different runs share one stored copy.
+    Attributes:
+        id (int): Unique identifier for the fetch.
+        url (str): The URL that was fetched.
+        page_hash (str): SHA-256 of the page content.
+        size (int): Uncompressed size of the content in bytes.
+        fetched_at (datetime): When the page was fetched.
+    """
+    __tablename__ = "archived_pages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, index=True)
+    page_hash = Column(String, index=True)
+    size = Column(Integer)
+    fetched_at = Column(DateTime)
+
+
+class Station(Base):
+    """
+    Represents a water storage or weather station reported by a bulk feed.
+    Codes are only unique within a feed, so a feed and code identify a station.
+    Attributes:
+        id (int): Unique identifier for the station.
+        code (str): The feed's identifier for the station (e.g. a BoM station number).
+        name (str): Name of the station.
+        kind (str): "water" or "weather".
+        latitude (float): Latitude in decimal degrees.
+        longitude (float): Longitude in decimal degrees.
+        feed (str): The feed that reports the station.
+    """
+    __tablename__ = "stations"
+    __table_args__ = (Index("ix_stations_feed_code", "feed", "code", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    feed = Column(String, nullable=False)
+    code = Column(String, nullable=False)
+    name = Column(String)
+    kind = Column(String, index=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+
+
+class StationReading(Base):
+    """
+    Represents one reading of one metric at a station.
+    A station, metric and timestamp identify a reading, so re-ingesting a feed
+    overwrites values instead of duplicating them.
+    Attributes:
+        id (int): Unique identifier for the reading.
+        station_id (int): The station the reading is from.
+        metric (str): What was measured (e.g. "storage_percent", "rainfall_mm").
+        timestamp (datetime): When the reading was taken.
+        value (float): The reading.
+    """
+    __tablename__ = "station_readings"
+    __table_args__ = (UniqueConstraint("station_id", "metric", "timestamp"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    station_id = Column(Integer, ForeignKey("stations.id"), nullable=False)
+    metric = Column(String, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    value = Column(Float)
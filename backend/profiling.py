@@ -0,0 +1,225 @@
+import contextvars
+import fcntl
+import functools
+import hmac
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # Profiling is disabled unless this is set
+SAMPLE_INTERVAL = 0.001  # Seconds between stack samples
+SCRAPE_PROFILE_FILE = Path("./data/scrape_profiles.json")  # Shared with the scrape workers
+SCRAPE_PROFILES_KEPT = 50
+
+# Leaf frames of threads that are just waiting, left out of request profiles
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get")}
+
+_spans = threading.local()
+_request_profiler = contextvars.ContextVar("request_profiler", default=None)
+
+
+def check_token(token):
+    """
+    Check a profiling token against PROFILE_TOKEN.
+    Args:
+        token (str): The token from the request.
+    Returns:
+        bool: True if profiling is enabled and the token matches.
+    """
+    # Compare bytes: compare_digest rejects str with non-ASCII characters
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads serving one request from a background thread.
+    Sync endpoints run in a thread pool, so a per-thread profiler started in the
+    request's own thread would miss the actual work; instead the endpoint's thread
+    registers itself (see sample_request_thread()) and only registered threads are sampled.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.threads = set()  # idents of the threads currently working on the request
+        self.samples = 0
+        self.inclusive = Counter()  # "file:function" -> samples with it anywhere on the stack
+        self.leaf = Counter()  # "file:function" -> samples with it at the top of the stack
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._elapsed = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+
+    @contextmanager
+    def sampling_thread(self):
+        """
+        Sample the calling thread while the block runs.
+        """
+        ident = threading.get_ident()
+        self.threads.add(ident)
+        try:
+            yield
+        finally:
+            self.threads.discard(ident)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            threads = set(self.threads)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in threads:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in IDLE_FRAMES:
+                    continue
+                self.samples += 1
+                self.leaf[f"{leaf[0]}:{leaf[1]}"] += 1
+                seen = set()
+                while frame is not None:
+                    name = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+                    if name not in seen:
+                        seen.add(name)
+                        self.inclusive[name] += 1
+                    frame = frame.f_back
+
+    def report(self, top=30):
+        """
+        Format the profile as text.
+        Args:
+            top (int): Number of functions to list.
+        Returns:
+            str: The busiest functions by inclusive and self samples.
+        """
+        lines = [f"{self.samples} samples over {self._elapsed * 1000:.1f} ms "
+                 f"(every {self.interval * 1000:g} ms)", "", "inclusive  self  function"]
+        for name, count in self.inclusive.most_common(top):
+            lines.append(f"{count:9d} {self.leaf[name]:5d}  {name}")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profiling_request(profiler):
+    """
+    Make a profiler the one that endpoints of the current request register with.
+    Args:
+        profiler (SamplingProfiler): The request's profiler.
+    """
+    token = _request_profiler.set(profiler)
+    try:
+        yield
+    finally:
+        _request_profiler.reset(token)
+
+
+def sample_request_thread(endpoint):
+    """
+    Wrap an endpoint so the thread running it is sampled when its request is being profiled.
+    Async endpoints share the event loop thread with other requests, so their profiles
+    can include whatever else the loop runs meanwhile.
+    Args:
+        endpoint (Callable): The endpoint function.
+    Returns:
+        Callable: The wrapped endpoint.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profiler = _request_profiler.get()
+            if profiler is None:
+                return await endpoint(*args, **kwargs)
+            with profiler.sampling_thread():
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            profiler = _request_profiler.get()
+            if profiler is None:
+                return endpoint(*args, **kwargs)
+            with profiler.sampling_thread():
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a stage of a scrape cycle (e.g. "fetch", "fx") if spans are being recorded.
+    Args:
+        stage (str): The stage name.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans = getattr(_spans, "current", None)
+        if spans is not None:
+            spans[stage] = spans.get(stage, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def record_spans():
+    """
+    Collect the span() timings made in this thread.
+    Yields:
+        dict: Seconds spent per stage, filled in as the block runs.
+    """
+    previous = getattr(_spans, "current", None)
+    _spans.current = {}
+    try:
+        yield _spans.current
+    finally:
+        _spans.current = previous
+
+
+def save_scrape_profile(source, stages, error=None):
+    """
+    Record the stage timings of one scrape cycle, keeping the last SCRAPE_PROFILES_KEPT.
+    Args:
+        source (str): The commodity key that was scraped.
+        stages (dict): Seconds spent per stage.
+        error (str, optional): The error the cycle failed with.
+    """
+    SCRAPE_PROFILE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # Every worker process writes this file, so hold an exclusive lock across the
+    # read-modify-write; readers don't need it since the file is replaced whole
+    with open(SCRAPE_PROFILE_FILE.with_suffix(".json.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        profiles = load_scrape_profiles()
+        profiles.append({
+            "source": source,
+            "finished_at": datetime.now().isoformat(),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+            "error": error,
+        })
+
+        tmp_file = SCRAPE_PROFILE_FILE.with_suffix(".json.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(profiles[-SCRAPE_PROFILES_KEPT:], f, indent=4)
+        tmp_file.replace(SCRAPE_PROFILE_FILE)
+
+
+def load_scrape_profiles():
+    """
+    Load the recorded scrape cycles, oldest first.
+    Returns:
+        list[dict]: The recorded cycles.
+    """
+    if not SCRAPE_PROFILE_FILE.exists():
+        return []
+    with open(SCRAPE_PROFILE_FILE, "r") as f:
+        return json.load(f)
@@ -0,0 +1,127 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from archive import read_page
+from cache import history_cache
+from commodity_scraper import PAGE_PARSERS
+from db import SessionLocal, init_db, get_commodity_id
+from models import Price, ArchivedPage
+from timeseries import series_store
+
+REPARSE_PROCESSES = os.cpu_count() or 2
+REPARSED_FIELDS = ("price", "currency", "change", "unit", "native_price", "native_currency", "native_unit")
+
+
+def parse_archived_page(page_hash, url, exchange_rate):
+    """
+    Run the current parsers for a URL over an archived page.
+    Args:
+        page_hash (str): The page hash.
+        url (str): The URL the page was fetched from.
+        exchange_rate (float): The USD to AUD rate recorded with the page's prices.
+    Returns:
+        tuple[str, list[dict], str]: The page hash, the parsed price data, and an error message if
+            any parser failed.
+    """
+    try:
+        content = read_page(page_hash)
+    except Exception as e:
+        return page_hash, [], str(e)
+
+    records, errors = [], []
+    for parser in PAGE_PARSERS.get(url, []):
+        try:
+            parsed = parser(content, exchange_rate)
+            records += parsed if isinstance(parsed, list) else [parsed]
+        except Exception as e:
+            errors.append(f"{parser.__name__}: {e}")
+    return page_hash, records, "; ".join(errors) or None
+
+
+def reparse(since=None, url=None, processes=REPARSE_PROCESSES, dry_run=False):
+    """
+    Re-run the current parsers over archived pages and rewrite the prices they produced.
+    Args:
+        since (datetime, optional): Only re-parse prices recorded at or after this time.
+        url (str, optional): Only re-parse pages fetched from this URL.
+        processes (int): Number of parser processes.
+        dry_run (bool): Report changes without writing them.
+    Returns:
+        int: The number of rows changed.
+    """
+    session = SessionLocal()
+    try:
+        query = session.query(Price).filter(Price.page_hash.isnot(None))
+        if since:
+            query = query.filter(Price.timestamp >= since)
+        rows = query.all()
+
+        # Group the rows by the page they came from
+        pages = {}
+        for row in rows:
+            pages.setdefault(row.page_hash, []).append(row)
+        urls = dict(
+            session.query(ArchivedPage.page_hash, ArchivedPage.url)
+            .filter(ArchivedPage.page_hash.in_(list(pages)))
+            .distinct()
+            .all()
+        )
+        tasks = [
+            (page_hash, urls[page_hash], next((r.fx_rate for r in page_rows if r.fx_rate), None))
+            for page_hash, page_rows in pages.items()
+            if page_hash in urls and urls[page_hash] in PAGE_PARSERS and (url is None or urls[page_hash] == url)
+        ]
+        print(f"Re-parsing {len(tasks)} archived page(s) for {len(rows)} price(s).")
+
+        changed, commodities = 0, set()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = pool.map(parse_archived_page, *zip(*tasks)) if tasks else []
+            for page_hash, records, error in results:
+                if error:
+                    print(f"Error re-parsing page {page_hash}: {error}")
+                parsed = {record["commodity"]: record for record in records}
+                for row in pages[page_hash]:
+                    record = parsed.get(row.commodity)
+                    if record is None:
+                        continue
+                    updates = {f: record[f] for f in REPARSED_FIELDS if f in record and getattr(row, f) != record[f]}
+                    if not updates:
+                        continue
+                    print(f"{row.commodity} at {row.timestamp}: {', '.join(f'{f} {getattr(row, f)} -> {v}' for f, v in updates.items())}")
+                    if "unit" in updates or "currency" in updates:
+                        # Unit and currency live on the commodity, so move the row to the right one
+                        row.commodity_id = get_commodity_id(row.commodity, record["unit"], record["currency"])
+                    for field, value in updates.items():
+                        if field not in ("unit", "currency"):
+                            setattr(row, field, value)
+                    changed += 1
+                    commodities.add(row.commodity)
+
+        if dry_run or not changed:
+            session.rollback()
+            print(f"{changed} price(s) would change." if dry_run else "No prices changed.")
+            return changed
+
+        session.commit()
+        # Bring the derived stores back in line with the rewritten rows. Rebuild the series
+        # first, so a request between the two can't cache the old series as current
+        series_store.rebuild(session)
+        for commodity in commodities:
+            history_cache.invalidate(commodity)
+        print(f"Rewrote {changed} price(s) across {len(commodities)} commodities.")
+        return changed
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-parse archived pages with the current scrapers and fix stored prices.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only prices recorded at or after this ISO timestamp")
+    parser.add_argument("--url", help="only pages fetched from this URL")
+    parser.add_argument("--processes", type=int, default=REPARSE_PROCESSES, help="number of parser processes")
+    parser.add_argument("--dry-run", action="store_true", help="show what would change without writing")
+    args = parser.parse_args()
+
+    init_db()
+    reparse(args.since, args.url, args.processes, args.dry_run)
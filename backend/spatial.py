@@ -0,0 +1,319 @@
+import heapq
+import math
+import os
+import threading
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+from sqlalchemy import text
+from db import SessionLocal, engine
+from models import Station
+
+STATIONS_STAMP = Path("./data/stations.stamp")  # Touched whenever station rows change
+STATION_RTREE = os.getenv("STATION_RTREE", "0") == "1"  # Also keep stations in a SQLite R*Tree and answer bbox queries from it
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16  # Stations per KD-tree leaf, compared with one vectorized distance calculation
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """
+    Convert latitudes and longitudes into points on the unit sphere.
+    Straight-line distance between these points orders stations the same way as
+    great-circle distance, without special cases at the antimeridian or the poles.
+    Args:
+        latitudes (array-like): Latitudes in decimal degrees.
+        longitudes (array-like): Longitudes in decimal degrees.
+    Returns:
+        np.ndarray: An (n, 3) array of x, y, z coordinates.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(squared_chord):
+    """
+    Convert a squared straight-line distance between unit vectors into kilometres along the surface.
+    Args:
+        squared_chord (float): The squared distance.
+    Returns:
+        float: The great-circle distance in km.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class KDTree:
+    """
+    Static KD-tree over 3D points for k-nearest-neighbour queries.
+    Nodes live in flat lists and the points are reordered so every leaf is a
+    contiguous slice, compared against the query point in one numpy call.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.order = np.arange(len(points))  # tree position -> index into the original points
+        self.leaf_size = leaf_size
+        self._start, self._end, self._axis, self._split, self._left, self._right = [], [], [], [], [], []
+        self._points = np.asarray(points, dtype=np.float64)
+        if len(points):
+            self._build(0, len(points))
+        self._points = self._points[self.order]
+
+    def _build(self, start, end):
+        node = len(self._start)
+        self._start.append(start)
+        self._end.append(end)
+        self._axis.append(-1)
+        self._split.append(0.0)
+        self._left.append(-1)
+        self._right.append(-1)
+        if end - start <= self.leaf_size:
+            return node
+
+        # Split on the widest axis at the median, so the tree stays balanced
+        indexes = self.order[start:end]
+        points = self._points[indexes]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        mid = (start + end) // 2
+        self.order[start:end] = indexes[np.argpartition(points[:, axis], mid - start)]
+        self._axis[node] = axis
+        self._split[node] = float(self._points[self.order[mid], axis])
+        self._left[node] = self._build(start, mid)
+        self._right[node] = self._build(mid, end)
+        return node
+
+    def query(self, point, k):
+        """
+        Find the k points nearest to a point.
+        Args:
+            point (array-like): The query point (x, y, z).
+            k (int): How many points to return.
+        Returns:
+            list[tuple[float, int]]: (squared distance, original index) pairs, nearest first.
+        """
+        if not self._start or k <= 0:
+            return []
+        target = np.asarray(point, dtype=np.float64)
+        coords = target.tolist()
+        best = []  # max-heap of (-squared distance, tree position)
+
+        def visit(node):
+            axis = self._axis[node]
+            if axis < 0:
+                start = self._start[node]
+                distances = ((self._points[start:self._end[node]] - target) ** 2).sum(axis=1)
+                for position, distance in enumerate(distances.tolist(), start):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, position))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, position))
+                return
+            diff = coords[axis] - self._split[node]
+            near, far = (self._left[node], self._right[node]) if diff < 0 else (self._right[node], self._left[node])
+            visit(near)
+            # Only cross the split if the far side could still hold something closer
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(0)
+        return [(-distance, int(self.order[position])) for distance, position in sorted(best, reverse=True)]
+
+
+# Everything a query reads, built together and swapped in as one object so a query
+# running during a rebuild sees either the old index or the new one, never a mix.
+# groups: kind (None for every station) -> (KDTree, station positions, positions by latitude, sorted latitudes)
+IndexSnapshot = namedtuple("IndexSnapshot", ["stations", "longitudes", "groups"])
+
+
+class StationIndex:
+    """
+    In-memory spatial index of stations, rebuilt from the stations table when it changes.
+    Stations are grouped by kind (plus one group of all stations). Each group has a KD-tree
+    for nearest-station queries and a latitude-sorted view for bounding box queries.
+    Writers call mark_stations_changed() and readers reload when the stamp file moves,
+    so stations ingested by other processes show up on the next query.
+    Attributes:
+        stamp_file (Path): The file touched when stations change.
+        rtree (bool): Answer bounding box queries from the SQLite R*Tree instead of memory.
+    """
+
+    def __init__(self, stamp_file=STATIONS_STAMP, rtree=STATION_RTREE):
+        self.stamp_file = Path(stamp_file)
+        self.rtree = rtree
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._loaded = False
+        self._snapshot = IndexSnapshot([], np.empty(0), {})
+
+    def build(self, stations):
+        """
+        Replace the index contents.
+        Args:
+            stations (list[dict]): Stations with id, feed, code, name, kind, latitude and longitude.
+                Stations without coordinates are left out.
+        """
+        stations = [s for s in stations if s["latitude"] is not None and s["longitude"] is not None]
+        latitudes = np.array([s["latitude"] for s in stations], dtype=np.float64)
+        longitudes = np.array([s["longitude"] for s in stations], dtype=np.float64)
+        kinds = np.array([s["kind"] or "" for s in stations], dtype=object)
+
+        groups = {}
+        for kind in [None] + sorted(set(kinds.tolist())):
+            members = np.arange(len(stations)) if kind is None else np.flatnonzero(kinds == kind)
+            by_latitude = members[np.argsort(latitudes[members], kind="stable")]
+            groups[kind] = (
+                KDTree(to_unit_vectors(latitudes[members], longitudes[members])),
+                members,
+                by_latitude,
+                latitudes[by_latitude],
+            )
+        self._snapshot = IndexSnapshot(stations, longitudes, groups)
+        self._loaded = True
+
+    def _ensure_current(self):
+        with self._lock:
+            stamp = self.stamp_file.stat().st_mtime_ns if self.stamp_file.exists() else None
+            if self._loaded and stamp == self._stamp:
+                return
+            # Record the stamp before reading, so a change made during the load triggers another
+            self._stamp = stamp
+            session = SessionLocal()
+            try:
+                rows = session.query(Station).all()
+                self.build([{
+                    "id": row.id,
+                    "feed": row.feed,
+                    "code": row.code,
+                    "name": row.name,
+                    "kind": row.kind,
+                    "latitude": row.latitude,
+                    "longitude": row.longitude,
+                } for row in rows])
+            finally:
+                session.close()
+            print(f"Indexed {len(self._snapshot.stations)} station(s).")
+
+    def nearest(self, latitude, longitude, k=5, kind=None, refresh=True):
+        """
+        Find the stations nearest to a point.
+        Args:
+            latitude (float): Latitude of the point.
+            longitude (float): Longitude of the point.
+            k (int): How many stations to return.
+            kind (str, optional): Only consider stations of this kind ("water" or "weather").
+            refresh (bool): Reload the index first if the stations have changed.
+        Returns:
+            list[dict]: The stations, nearest first, each with its distance_km.
+        """
+        if refresh:
+            self._ensure_current()
+        snapshot = self._snapshot
+        if kind not in snapshot.groups:
+            return []
+        tree, members, _, _ = snapshot.groups[kind]
+        point = to_unit_vectors([latitude], [longitude])[0]
+        return [
+            {**snapshot.stations[members[index]], "distance_km": round(chord_to_km(distance), 3)}
+            for distance, index in tree.query(point, k)
+        ]
+
+    def within(self, min_lat, min_lon, max_lat, max_lon, kind=None, refresh=True):
+        """
+        Find the stations inside a bounding box.
+        Args:
+            min_lat (float): Southern edge.
+            min_lon (float): Western edge. Greater than max_lon for boxes crossing the antimeridian.
+            max_lat (float): Northern edge.
+            max_lon (float): Eastern edge.
+            kind (str, optional): Only include stations of this kind.
+            refresh (bool): Reload the index first if the stations have changed.
+        Returns:
+            list[dict]: The stations, south to north.
+        """
+        if self.rtree:
+            stations = rtree_within(min_lat, min_lon, max_lat, max_lon, kind)
+            if stations is not None:
+                return stations
+        if refresh:
+            self._ensure_current()
+        snapshot = self._snapshot
+        if kind not in snapshot.groups:
+            return []
+        _, _, by_latitude, sorted_latitudes = snapshot.groups[kind]
+        band = by_latitude[np.searchsorted(sorted_latitudes, min_lat, "left"):np.searchsorted(sorted_latitudes, max_lat, "right")]
+        lons = snapshot.longitudes[band]
+        if min_lon <= max_lon:
+            inside = (lons >= min_lon) & (lons <= max_lon)
+        else:
+            inside = (lons >= min_lon) | (lons <= max_lon)
+        return [snapshot.stations[index] for index in band[inside].tolist()]
+
+
+def mark_stations_changed():
+    """
+    Tell every process's station index to reload on its next query.
+    Call after committing changes to the stations table.
+    """
+    STATIONS_STAMP.parent.mkdir(parents=True, exist_ok=True)
+    STATIONS_STAMP.touch()
+
+
+def sync_rtree(conn, ids=None):
+    """
+    Copy station positions into the station_rtree R*Tree table, creating it if needed.
+    Args:
+        conn (Connection): A connection inside the transaction that changed the stations.
+        ids (list[int], optional): Only copy these stations. Every station is copied when
+            the table is first created.
+    """
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'station_rtree'")).first()
+    if not exists:
+        conn.execute(text("CREATE VIRTUAL TABLE station_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)"))
+        ids = None
+    insert = ("INSERT INTO station_rtree "
+              "SELECT id, latitude, latitude, longitude, longitude FROM stations "
+              "WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+    if ids is None:
+        conn.execute(text("DELETE FROM station_rtree"))
+        conn.execute(text(insert))
+        return
+    # Stay under SQLite's bound parameter limit
+    for i in range(0, len(ids), 500):
+        params = {f"s{j}": station_id for j, station_id in enumerate(ids[i:i + 500])}
+        placeholders = ", ".join(f":{name}" for name in params)
+        # Delete then insert, so stations that lost their coordinates drop out
+        conn.execute(text(f"DELETE FROM station_rtree WHERE id IN ({placeholders})"), params)
+        conn.execute(text(f"{insert} AND id IN ({placeholders})"), params)
+
+
+def rtree_within(min_lat, min_lon, max_lat, max_lon, kind=None):
+    """
+    Find the stations inside a bounding box using the SQLite R*Tree.
+    Args:
+        min_lat (float): Southern edge.
+        min_lon (float): Western edge. Greater than max_lon for boxes crossing the antimeridian.
+        max_lat (float): Northern edge.
+        max_lon (float): Eastern edge.
+        kind (str, optional): Only include stations of this kind.
+    Returns:
+        list[dict] | None: The stations, south to north, or None if no feed ingest has created
+            the R*Tree yet.
+    """
+    # A box crossing the antimeridian is two boxes to the R*Tree
+    spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    stations = []
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'station_rtree'")).first():
+            return None
+        for west, east in spans:
+            rows = conn.execute(text(
+                "SELECT s.id, s.feed, s.code, s.name, s.kind, s.latitude, s.longitude "
+                "FROM station_rtree r JOIN stations s ON s.id = r.id "
+                "WHERE r.max_lat >= :min_lat AND r.min_lat <= :max_lat "
+                "AND r.max_lon >= :west AND r.min_lon <= :east "
+                "AND (:kind IS NULL OR s.kind = :kind)"
+            ), {"min_lat": min_lat, "max_lat": max_lat, "west": west, "east": east, "kind": kind}).mappings().all()
+            stations += [dict(row) for row in rows]
+    return sorted(stations, key=lambda s: s["latitude"])
+
+
+station_index = StationIndex()
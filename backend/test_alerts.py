@@ -0,0 +1,93 @@
+"""
+Tests for the price alert engine.
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+import alerts
+from alerts import AlertEngine
+from timeseries import PriceSeriesStore
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, batch):
+        self.sent += batch
+
+
+def subscription(id, kind, threshold, commodity="cotton z26", window_days=7):
+    return SimpleNamespace(id=id, commodity=commodity, kind=kind, threshold=threshold,
+                           window_days=window_days, channel="email", target="ops@example.com")
+
+
+def test_only_crossed_thresholds_fire(tmp_path, monkeypatch):
+    store = PriceSeriesStore(tmp_path)
+    monkeypatch.setattr(alerts, "series_store", store)
+    engine = AlertEngine(RecordingDispatcher())
+    for sub in [subscription(1, "above", 700), subscription(2, "above", 650), subscription(3, "above", 800),
+                subscription(4, "below", 600), subscription(5, "above", 650, commodity="wheat")]:
+        engine.add(sub)
+
+    store.append("Cotton (Cotton Z26)", datetime(2025, 1, 1), 640.0)
+    fired = engine.on_price("Cotton (Cotton Z26)", 720.0, datetime(2025, 1, 2))
+    assert sorted(a["subscription_id"] for a in fired) == [1, 2]
+
+    store.append("Cotton (Cotton Z26)", datetime(2025, 1, 2), 720.0)
+    engine.remove(4)
+    assert engine.on_price("Cotton (Cotton Z26)", 590.0, datetime(2025, 1, 3)) == []
+
+
+def test_move_alert_fires_once_when_exceeded(tmp_path, monkeypatch):
+    store = PriceSeriesStore(tmp_path)
+    monkeypatch.setattr(alerts, "series_store", store)
+    engine = AlertEngine(RecordingDispatcher())
+    engine.add(subscription(1, "move", 3.0, commodity="beef"))
+
+    store.append("Beef (EYCI)", datetime(2025, 1, 1), 500.0)
+    store.append("Beef (EYCI)", datetime(2025, 1, 8), 505.0)
+    fired = engine.on_price("Beef (EYCI)", 520.0, datetime(2025, 1, 9))
+    assert [a["subscription_id"] for a in fired] == [1]
+
+    store.append("Beef (EYCI)", datetime(2025, 1, 9), 520.0)
+    assert engine.on_price("Beef (EYCI)", 525.0, datetime(2025, 1, 10)) == []
+
+
+class FakeSession:
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+        self.loads = 0
+
+    def query(self, model):
+        self.loads += 1
+        return SimpleNamespace(all=lambda: list(self.subscriptions))
+
+
+def test_refresh_reloads_only_after_subscriptions_change(tmp_path, monkeypatch):
+    store = PriceSeriesStore(tmp_path)
+    monkeypatch.setattr(alerts, "series_store", store)
+    monkeypatch.setattr(alerts, "ALERTS_STAMP", tmp_path / "alerts.stamp")
+    engine = AlertEngine(RecordingDispatcher(), stamp_file=tmp_path / "alerts.stamp")
+    session = FakeSession([subscription(i, "above", 900 - i) for i in range(200)])
+
+    engine.refresh(session)
+    engine.refresh(session)
+    assert session.loads == 1
+    store.append("Cotton (Cotton Z26)", datetime(2025, 1, 1), 700.0)
+    assert len(engine.on_price("Cotton (Cotton Z26)", 710.0, datetime(2025, 1, 2))) == 10
+
+    session.subscriptions.append(subscription(200, "below", 695))
+    alerts.mark_alerts_changed()
+    engine.refresh(session)
+    assert session.loads == 2
+    assert [a["subscription_id"] for a in engine.on_price("Cotton (Cotton Z26)", 690.0, datetime(2025, 1, 2))] == [200]
+
+
+def test_webhooks_must_be_public_http():
+    alerts.check_webhook_target("https://93.184.216.34/hook")
+    for url in ["ftp://93.184.216.34/hook", "http://127.0.0.1:8080/", "http://10.0.0.5/hook",
+                "http://169.254.169.254/latest", "http://[::1]/hook", "https:///hook"]:
+        with pytest.raises(ValueError):
+            alerts.check_webhook_target(url)
@@ -0,0 +1,36 @@
+"""
+Tests for the /history result cache.
+"""
+
+from cache import HistoryCache
+
+
+def test_invalidate_only_matching_terms():
+    cache = HistoryCache()
+    cache.put("cotton", ("history", None, None), b"[1]", cache.generation)
+    cache.put("wheat", ("history", None, None), b"[2]", cache.generation)
+
+    cache.invalidate("Cotton (Cotton Z26)")
+
+    assert cache.get("cotton", ("history", None, None)) is None
+    assert cache.get("Wheat", ("history", None, None)) == b"[2]"
+
+
+def test_stale_put_is_discarded():
+    cache = HistoryCache()
+    generation = cache.generation
+    cache.invalidate("Beef (Eastern Young Cattle Indicator)")
+    cache.put("beef", ("series", None, None), b"[]", generation)
+    assert cache.get("beef", ("series", None, None)) is None
+
+
+def test_evicts_least_recently_used():
+    cache = HistoryCache(max_bytes=8)
+    cache.put("a", (), b"1234", cache.generation)
+    cache.put("b", (), b"1234", cache.generation)
+    cache.get("a", ())
+    cache.put("c", (), b"1234", cache.generation)
+
+    assert cache.get("b", ()) is None
+    assert cache.get("a", ()) == b"1234"
+    assert cache.size == 8
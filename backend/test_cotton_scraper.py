@@ -4,7 +4,7 @@ Test script for the cotton futures scraper.
 This script tests the scrape_cotton_futures() function to ensure it works correctly.
 """
 
-from commodity_scraper import scrape_cotton_futures
+from commodity_scraper import scrape_cotton_futures, parse_cotton_futures_chain
 import traceback
 
 def test_cotton_futures():
@@ -57,6 +57,27 @@ def test_cotton_futures():
         traceback.print_exc()
         return False
 
+def test_parse_cotton_futures_chain():
+    """Test parsing a Barchart quotes payload without hitting the network."""
+    payload = {"data": [
+        {"symbol": "CTY00", "lastPrice": "66.10s", "raw": {"lastPrice": 66.1, "priceChange": 0.2, "percentChange": 0.003}},
+        {"symbol": "CTN27", "lastPrice": "70.25", "percentChange": "+0.20%", "raw": {"expirationDate": "2027-07-09"}},
+        {"symbol": "CTZ26", "lastPrice": "68.02", "priceChange": "-0.40", "percentChange": None,
+         "raw": {"expirationDate": "2026-12-08"}},
+        {"symbol": "CTK27", "lastPrice": "N/A"},
+        {"symbol": "CTH27", "lastPrice": "69.50", "priceChange": "+0.10", "percentChange": "+0.14%",
+         "expirationDate": "03/09/27"},
+    ]}
+
+    results = parse_cotton_futures_chain(payload, exchange_rate=1.5, contracts=2)
+
+    assert [r["commodity"] for r in results] == ["Cotton (Cotton Cash)", "Cotton (Cotton Z26)", "Cotton (Cotton H27)"]
+    assert results[0]["price"] == round(66.1 * 1.5 / 100 * 500, 2)
+    assert results[0]["change"] == 0.3
+    assert results[1]["change"] == round(-0.40 / 68.42 * 100, 2)
+    assert results[2]["change"] == 0.14
+    assert results[1]["source"] == "https://www.barchart.com/futures/quotes/CTZ26"
+
 if __name__ == "__main__":
     success = test_cotton_futures()
     if success:
@@ -0,0 +1,26 @@
+"""
+Tests for vectorized currency and unit conversion.
+"""
+
+import pytest
+from currency import ExchangeRateUnavailable, convert_prices
+
+
+def test_convert_cotton_to_aud_per_bale():
+    # 70 USc/lb at 1.5 AUD per USD is 0.70 * 1.5 * 500 = 525 AUD/bale
+    prices = convert_prices([70.0, 80.0], ["c/lb", "c/lb"], ["USD", "USD"], [1.5, 1.6], unit="$/bale", currency="AUD")
+    assert prices.round(2).tolist() == [525.0, 640.0]
+
+
+def test_convert_uses_fallback_rate_only_when_missing():
+    prices = convert_prices([300.0, 1.0], ["$/tonne", "$/tonne"], ["AUD", "USD"], [None, None], currency="USD",
+                            fallback_rate=lambda: 1.5)
+    assert prices.tolist() == [200.0, 1.0]
+
+    with pytest.raises(ExchangeRateUnavailable):
+        convert_prices([300.0], ["$/tonne"], ["AUD"], [None], currency="USD", fallback_rate=lambda: None)
+
+
+def test_convert_rejects_unknown_unit():
+    with pytest.raises(ValueError):
+        convert_prices([1.0], ["head"], ["AUD"], [None], unit="$/kg")
@@ -0,0 +1,76 @@
+"""
+Tests for the database helpers.
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+import db
+import main
+from cache import HistoryCache
+from db import find_commodity_ids, init_db, normalize_prices
+from models import Base, Commodity, Price
+
+DPI = "https://www.dpi.nsw.gov.au/agriculture/commodity-report"
+ABARES = "https://www.agriculture.gov.au/abares/data/weekly-commodity-price-update"
+
+
+def test_search_terms_match_literally():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([Commodity(name="Wheat (H2)"), Commodity(name="Wheat_ (test)"), Commodity(name="Barley 100%")])
+    session.commit()
+
+    def names(term):
+        return sorted(session.get(Commodity, i).name for i in find_commodity_ids(session, term))
+
+    assert names("wheat") == ["Wheat (H2)", "Wheat_ (test)"]
+    assert names("wheat_") == ["Wheat_ (test)"]
+    assert names("%") == ["Barley 100%"]
+    assert names("\\") == []
+
+
+def test_legacy_prices_are_normalized_once(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'prices.db'}")
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(db, "_commodity_ids", {})
+    monkeypatch.setattr(db, "_source_ids", {})
+    monkeypatch.setattr(main, "history_cache", HistoryCache())
+
+    # The prices table as the baseline release created it
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE prices (id INTEGER PRIMARY KEY, commodity VARCHAR, price FLOAT, "
+                          "currency VARCHAR, change FLOAT, unit VARCHAR, timestamp DATETIME, source VARCHAR)"))
+        conn.execute(text("INSERT INTO prices VALUES (:id, :commodity, :price, :currency, :change, :unit, :timestamp, :source)"), [
+            {"id": 3, "commodity": "Wheat (H2)", "price": 310.0, "currency": "AUD", "change": 0.5, "unit": "$/tonne",
+             "timestamp": datetime(2025, 1, 1), "source": DPI},
+            {"id": 7, "commodity": "Wheat (H2)", "price": 312.0, "currency": "AUD", "change": 0.6, "unit": "$/tonne",
+             "timestamp": datetime(2025, 1, 2), "source": DPI},
+            {"id": 9, "commodity": "Beef (EYCI)", "price": 650.0, "currency": None, "change": None, "unit": None,
+             "timestamp": datetime(2025, 1, 2), "source": ABARES},
+        ])
+
+    for _ in range(2):
+        init_db()
+        normalize_prices()
+
+    columns = {column["name"] for column in inspect(engine).get_columns("prices")}
+    assert not {"commodity", "unit", "currency", "source"} & columns
+    session = db.SessionLocal()
+    try:
+        assert session.query(Commodity).count() == 2
+        prices = {p.id: (p.commodity, p.price, p.unit, p.currency, p.source) for p in session.query(Price)}
+        assert prices == {
+            3: ("Wheat (H2)", 310.0, "$/tonne", "AUD", DPI),
+            7: ("Wheat (H2)", 312.0, "$/tonne", "AUD", DPI),
+            9: ("Beef (EYCI)", 650.0, "", "AUD", ABARES),
+        }
+
+        # Legacy rows without a unit now come back with "" rather than null
+        history = json.loads(main.get_historical_prices("beef", db=session).body)
+        assert [(row["unit"], row["currency"]) for row in history] == [("", "AUD")]
+    finally:
+        session.close()
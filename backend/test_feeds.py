@@ -0,0 +1,128 @@
+"""
+Tests for the bulk station feed pipeline, run against local sample files.
+"""
+
+import gzip
+import json
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, select
+import feeds
+import spatial
+from feeds import ingest_feed, iter_feed_rows, open_feed
+from models import Base, Station, StationReading
+
+CSV_FEED = (
+    "station_id,station_name,latitude,longitude,timestamp,volume_ml,percent_full,level_m\n"
+    "416300,Glenlyon Dam,-28.97,151.47,2025-06-01T09:00:00+10:00,180500,71.8,\n"
+    "416300,Glenlyon Dam,-28.97,151.47,2025-06-02T09:00:00+10:00,180100,71.6,\n"
+    "422400,Beardmore Dam,-27.98,148.63,2025-06-01T09:00:00+10:00,,,4.2\n"
+    "422400,Beardmore Dam,-27.98,148.63,2025-06-01T09:00:00+10:00,,250,\n"
+    ",No Code,-27.0,150.0,2025-06-01T09:00:00+10:00,1,1,1\n"
+)
+
+WEATHER_ROWS = [
+    {"station_id": "041525", "station_name": "Goondiwindi Airport", "latitude": -28.52, "longitude": 150.33,
+     "timestamp": "2025-06-01", "rainfall_mm": 12.4, "max_temp_c": 19.5, "min_temp_c": 4.1},
+    {"station_id": "041525", "station_name": "Goondiwindi Airport", "latitude": -28.52, "longitude": 150.33,
+     "timestamp": "2025-06-02", "rainfall_mm": 0.0, "max_temp_c": 21.0, "min_temp_c": None},
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(feeds, "engine", engine)
+    monkeypatch.setattr(spatial, "STATIONS_STAMP", tmp_path / "stations.stamp")
+    return engine
+
+
+def read_rows(path):
+    with open_feed(str(path)) as stream:
+        return list(iter_feed_rows(stream))
+
+
+def test_formats_and_gzip_are_detected_from_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(feeds, "CHUNK_SIZE", 16)  # Force elements to span read boundaries
+    (tmp_path / "feed.json").write_text(json.dumps(WEATHER_ROWS, indent=2))
+    (tmp_path / "feed.jsonl").write_text("\n".join(json.dumps(row) for row in WEATHER_ROWS) + "\n")
+    (tmp_path / "broken.jsonl").write_text(json.dumps(WEATHER_ROWS[0]) + '\n{"station_id": "0415\n')
+    with gzip.open(tmp_path / "feed.dat", "wt") as f:
+        f.write(CSV_FEED)
+
+    assert read_rows(tmp_path / "feed.json") == WEATHER_ROWS
+    assert read_rows(tmp_path / "feed.jsonl") == WEATHER_ROWS
+    assert isinstance(read_rows(tmp_path / "broken.jsonl")[1], ValueError)
+    rows = read_rows(tmp_path / "feed.dat")
+    assert len(rows) == 5 and rows[0]["station_name"] == "Glenlyon Dam"
+
+
+def test_ingest_validates_and_upserts(tmp_path, db):
+    path = tmp_path / "storage.csv.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(CSV_FEED)
+
+    stats = ingest_feed("water_storage", str(path), batch_size=2)
+    assert stats == {"rows": 5, "invalid": 2, "readings": 5, "stations": 2}
+
+    # Re-ingesting overwrites the same readings instead of adding more
+    ingest_feed("water_storage", str(path))
+    with db.connect() as conn:
+        readings = conn.execute(
+            select(Station.code, StationReading.metric, StationReading.timestamp, StationReading.value)
+            .join(Station, Station.id == StationReading.station_id)
+            .order_by(Station.code, StationReading.metric, StationReading.timestamp)
+        ).all()
+        station = conn.execute(select(Station).where(Station.code == "422400")).one()
+
+    assert len(readings) == 5
+    assert readings[0] == ("416300", "storage_ml", datetime(2025, 6, 1, 9), 180500.0)
+    assert (station.name, station.kind, station.latitude) == ("Beardmore Dam", "water", -27.98)
+
+
+def test_undecodable_json_lines_are_counted_as_invalid(tmp_path, db):
+    path = tmp_path / "weather.jsonl"
+    path.write_text(json.dumps(WEATHER_ROWS[0]) + "\n{not json\n" + json.dumps(WEATHER_ROWS[1]) + "\n")
+
+    stats = ingest_feed("weather", str(path))
+    assert (stats["rows"], stats["invalid"], stats["readings"]) == (3, 1, 5)
+
+
+def test_malformed_json_array_elements_are_counted_as_invalid(tmp_path, db, monkeypatch):
+    monkeypatch.setattr(feeds, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(feeds, "MAX_ELEMENT_SIZE", 512)  # Smaller than the feed, so it can't all be buffered
+    bad = ['{"station_id": oops, "note": "a, b ] }"}', '{"station_id": "x"' + ' ' * 1000 + '?}']
+    path = tmp_path / "weather.json"
+    path.write_text("[" + ",".join([json.dumps(WEATHER_ROWS[0]), *bad, json.dumps(WEATHER_ROWS[1])]) + "]")
+
+    stats = ingest_feed("weather", str(path))
+    assert (stats["rows"], stats["invalid"], stats["readings"]) == (4, 2, 5)
+
+    path.write_text("[" + json.dumps(WEATHER_ROWS[0]) + ', {"station_id": ')
+    rows = read_rows(path)
+    assert rows[0] == WEATHER_ROWS[0] and isinstance(rows[1], ValueError) and len(rows) == 2
+
+
+def test_station_codes_are_scoped_to_their_feed(tmp_path, db):
+    (tmp_path / "storage.csv").write_text(CSV_FEED)
+    (tmp_path / "weather.json").write_text(json.dumps([{**WEATHER_ROWS[0], "station_id": "416300"}]))
+    ingest_feed("water_storage", str(tmp_path / "storage.csv"))
+    ingest_feed("weather", str(tmp_path / "weather.json"))
+
+    with db.connect() as conn:
+        stations = conn.execute(select(Station.feed, Station.kind, Station.name).where(Station.code == "416300")
+                                .order_by(Station.feed)).all()
+    assert stations == [("water_storage", "water", "Glenlyon Dam"), ("weather", "weather", "Goondiwindi Airport")]
+
+
+def test_ingest_creates_and_backfills_the_rtree(tmp_path, db, monkeypatch):
+    (tmp_path / "storage.csv").write_text(CSV_FEED)
+    monkeypatch.setattr(spatial, "engine", db)
+    ingest_feed("water_storage", str(tmp_path / "storage.csv"))
+    assert spatial.rtree_within(-30, 145, -25, 155) is None  # Bbox queries never create it themselves
+
+    monkeypatch.setattr(feeds, "STATION_RTREE", True)
+    (tmp_path / "weather.json").write_text(json.dumps(WEATHER_ROWS))
+    ingest_feed("weather", str(tmp_path / "weather.json"))
+    assert [s["code"] for s in spatial.rtree_within(-30, 145, -25, 155)] == ["416300", "041525", "422400"]
@@ -0,0 +1,71 @@
+"""
+Tests for the station spatial index.
+"""
+
+import math
+import random
+from sqlalchemy import create_engine, text
+import spatial
+from spatial import StationIndex, sync_rtree, rtree_within
+from models import Base
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * spatial.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def random_stations(count, seed=7):
+    rng = random.Random(seed)
+    return [{"id": i, "feed": "weather", "code": f"S{i}", "name": f"Station {i}", "kind": rng.choice(["water", "weather"]),
+             "latitude": rng.uniform(-44, -10), "longitude": rng.uniform(112, 154)} for i in range(count)]
+
+
+def test_nearest_matches_brute_force():
+    stations = random_stations(3000)
+    index = StationIndex()
+    index.build(stations + [{"id": -1, "code": "X", "name": None, "kind": "water", "latitude": None, "longitude": None}])
+
+    rng = random.Random(1)
+    for _ in range(50):
+        lat, lon, kind = rng.uniform(-44, -10), rng.uniform(112, 154), rng.choice([None, "water", "weather"])
+        expected = sorted((haversine_km(lat, lon, s["latitude"], s["longitude"]), s["id"])
+                          for s in stations if kind is None or s["kind"] == kind)[:8]
+        found = index.nearest(lat, lon, 8, kind, refresh=False)
+        assert [s["id"] for s in found] == [station_id for _, station_id in expected]
+        assert math.isclose(found[0]["distance_km"], expected[0][0], abs_tol=0.01)
+
+
+def test_nearest_across_the_antimeridian():
+    index = StationIndex()
+    index.build([{"id": 1, "code": "A", "name": "Suva", "kind": "weather", "latitude": -18.1, "longitude": 178.4},
+                 {"id": 2, "code": "B", "name": "Apia", "kind": "weather", "latitude": -13.8, "longitude": -171.8},
+                 {"id": 3, "code": "C", "name": "Brisbane", "kind": "weather", "latitude": -27.5, "longitude": 153.0}])
+    assert [s["id"] for s in index.nearest(-16.0, -179.9, 2, refresh=False)] == [1, 2]
+
+
+def test_bbox_in_memory_and_rtree_agree(monkeypatch):
+    stations = random_stations(2000)
+    index = StationIndex(rtree=False)
+    index.build(stations)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for s in stations:
+            conn.execute(text("INSERT INTO stations (id, feed, code, name, kind, latitude, longitude) "
+                              "VALUES (:id, :feed, :code, :name, :kind, :latitude, :longitude)"), s)
+        sync_rtree(conn)
+    monkeypatch.setattr(spatial, "engine", engine)
+
+    box = (-30.0, 145.0, -25.0, 152.0)
+    expected = {s["id"] for s in stations if -30 <= s["latitude"] <= -25 and 145 <= s["longitude"] <= 152}
+    assert {s["id"] for s in index.within(*box, refresh=False)} == expected
+    assert {s["id"] for s in rtree_within(*box)} == expected
+    assert {s["id"] for s in index.within(*box, kind="water", refresh=False)} == \
+        {s["id"] for s in stations if s["id"] in expected and s["kind"] == "water"}
+
+    # Western edge east of the eastern edge wraps around the antimeridian
+    assert {s["id"] for s in index.within(-30.0, 150.0, -25.0, 120.0, refresh=False)} == \
+        {s["id"] for s in stations if -30 <= s["latitude"] <= -25 and (s["longitude"] >= 150 or s["longitude"] <= 120)}
@@ -0,0 +1,67 @@
+"""
+Tests for the memory-mapped price series store.
+"""
+
+from datetime import datetime
+import numpy as np
+from timeseries import PriceSeriesStore, RECORD_DTYPE, micros_to_iso, to_micros
+
+
+def test_append_and_range(tmp_path):
+    store = PriceSeriesStore(tmp_path)
+    store.append("Wheat (H2)", datetime(2025, 1, 1), 300.0)
+    store.append("Wheat (H2)", "2025-01-03T00:00:00+10:00", 310.0)
+    store.append("Wheat (H2)", datetime(2025, 1, 2), 305.0)  # out of order
+
+    timestamps, prices = store.range("Wheat (H2)")
+    assert prices.tolist() == [300.0, 305.0, 310.0]
+
+    timestamps, prices = store.range("Wheat (H2)", start="2025-01-02", end=datetime(2025, 1, 2))
+    assert micros_to_iso(timestamps) == ["2025-01-02T00:00:00.000000"]
+    assert prices.tolist() == [305.0]
+
+
+def test_store_reopens_from_disk(tmp_path):
+    PriceSeriesStore(tmp_path).append("Cotton (Cotton Z26)", datetime(2025, 1, 1), 650.0)
+
+    store = PriceSeriesStore(tmp_path)
+    assert store.commodities() == ["Cotton (Cotton Z26)"]
+    assert store.range("Cotton (Cotton Z26)")[1].tolist() == [650.0]
+    assert len(store.range("Beef")[0]) == 0
+
+
+def test_names_that_slugify_alike_stay_separate(tmp_path):
+    store = PriceSeriesStore(tmp_path)
+    store.append("Cotton (Z26)", datetime(2025, 1, 1), 650.0)
+    store.append("Cotton Z26", datetime(2025, 1, 1), 700.0)
+
+    store = PriceSeriesStore(tmp_path)
+    assert store.commodities() == ["Cotton (Z26)", "Cotton Z26"]
+    assert store.range("Cotton (Z26)")[1].tolist() == [650.0]
+    assert store.range("Cotton Z26")[1].tolist() == [700.0]
+    assert store.count() == 2
+
+
+def test_readers_only_see_whole_records(tmp_path):
+    store = PriceSeriesStore(tmp_path)
+    store.append("Wheat", datetime(2025, 1, 1), 300.0)
+    series_file = next(tmp_path.glob("*/series.bin"))
+    with open(series_file, "ab") as f:  # another process caught halfway through an append
+        f.write(np.array([(to_micros(datetime(2025, 1, 2)), 305.0)], RECORD_DTYPE).tobytes()[:12])
+
+    timestamps, prices = PriceSeriesStore(tmp_path).range("Wheat")
+    assert len(timestamps) == len(prices) == 1
+
+    store.append("Wheat", datetime(2025, 1, 3), 310.0)  # a torn tail is dropped, not built on
+    assert store.range("Wheat")[1].tolist() == [300.0, 310.0]
+
+
+def test_two_file_series_are_converted(tmp_path):
+    series_dir = tmp_path / "wheat"
+    series_dir.mkdir()
+    (series_dir / "meta.json").write_text('{"commodity": "Wheat"}')
+    np.array([to_micros(datetime(2025, 1, 1)), to_micros(datetime(2025, 1, 2))], "<i8").tofile(series_dir / "timestamps.bin")
+    np.array([300.0], "<f8").tofile(series_dir / "prices.bin")
+
+    assert PriceSeriesStore(tmp_path).range("Wheat")[1].tolist() == [300.0]
+    assert sorted(p.name for p in series_dir.iterdir()) == ["meta.json", "series.bin"]
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+from models import Price, Commodity
+
+SERIES_DIR = Path("./data/series")
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_DTYPE = np.dtype("<i8")  # microseconds since epoch (wall-clock, like the DB)
+PRICE_DTYPE = np.dtype("<f8")
+# One record per price, so a timestamp and its price are always written (and read) together
+RECORD_DTYPE = np.dtype([("timestamp", TIMESTAMP_DTYPE), ("price", PRICE_DTYPE)])
+SERIES_FILE = "series.bin"
+
+
+def to_micros(timestamp):
+    """
+    Convert a timestamp into integer microseconds since the epoch.
+    Timezone info is dropped so the value matches the wall-clock time stored in SQLite.
+    Args:
+        timestamp (datetime, str or int): The timestamp to convert (ints are returned as-is).
+    Returns:
+        int: Microseconds since 1970-01-01.
+    """
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    timestamp = timestamp.replace(tzinfo=None)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def micros_to_iso(timestamps):
+    """
+    Convert an array of epoch microseconds into ISO 8601 strings in one vectorized call.
+    Args:
+        timestamps (np.ndarray): Epoch microseconds.
+    Returns:
+        list[str]: ISO formatted timestamps.
+    """
+    return np.datetime_as_string(np.asarray(timestamps).astype("datetime64[us]")).tolist()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size
+
+
+def _slug(commodity):
+    # The hash keeps names that slugify alike (e.g. "Cotton (Z26)" and "Cotton Z26") apart
+    digest = hashlib.sha1(commodity.encode()).hexdigest()[:8]
+    return f'{re.sub(r"[^a-z0-9]+", "_", commodity.lower()).strip("_")}_{digest}'
+
+
+class PriceSeriesStore:
+    """
+    Append-only store of price history.
+    Each commodity gets a directory holding one flat little-endian file of
+    (timestamp, price) records, kept sorted by time. Reads memory-map the file
+    so range queries are a binary search plus a zero-copy slice.
+    Appends are a single write to that one file and rewrites replace it whole, so
+    readers in other processes never see a timestamp without its price; a reader
+    that catches an append half-written only maps the complete records.
+    The SQL table stays the source of truth; see rebuild().
+    Attributes:
+        root (Path): Directory the series are stored under.
+    """
+
+    def __init__(self, root=SERIES_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._maps = {}    # commodity -> (records memmap, (inode, size))
+        self._names = None  # commodity name -> series directory
+        self._names_mtime = None
+
+    def _load_names(self):
+        # Rescan when the root changes, so series created by other processes show up
+        mtime = self.root.stat().st_mtime_ns if self.root.exists() else None
+        if self._names is None or mtime != self._names_mtime:
+            self._names = {}
+            self._names_mtime = mtime
+            if self.root.exists():
+                for meta_file in self.root.glob("*/meta.json"):
+                    meta = json.loads(meta_file.read_text())
+                    self._names[meta["commodity"]] = meta_file.parent
+        return self._names
+
+    def _series_dir(self, commodity, create=False):
+        names = self._load_names()
+        series_dir = names.get(commodity)
+        if series_dir is None and create:
+            series_dir = self.root / _slug(commodity)
+            series_dir.mkdir(parents=True, exist_ok=True)
+            (series_dir / "meta.json").write_text(json.dumps({"commodity": commodity}))
+            names[commodity] = series_dir
+        if series_dir is not None and (series_dir / "timestamps.bin").exists():
+            self._convert_legacy(series_dir)
+        return series_dir
+
+    def _convert_legacy(self, series_dir):
+        # Older stores kept timestamps and prices in two files; merge them into records
+        if not (series_dir / SERIES_FILE).exists():
+            timestamps = np.fromfile(series_dir / "timestamps.bin", TIMESTAMP_DTYPE)
+            prices_file = series_dir / "prices.bin"
+            prices = np.fromfile(prices_file, PRICE_DTYPE) if prices_file.exists() else np.empty(0, PRICE_DTYPE)
+            length = min(len(timestamps), len(prices))
+            self._write(series_dir, timestamps[:length], prices[:length])
+        for name in ("timestamps.bin", "prices.bin"):
+            (series_dir / name).unlink(missing_ok=True)
+
+    def commodities(self):
+        """
+        List the commodity names held in the store.
+        Returns:
+            list[str]: Commodity names.
+        """
+        with self._lock:
+            return sorted(self._load_names())
+
+    def append(self, commodity, timestamp, price):
+        """
+        Append a price to a commodity's series, keeping it sorted by time.
+        Args:
+            commodity (str): The name of the commodity.
+            timestamp (datetime or str): The timestamp of the price.
+            price (float): The price value.
+        """
+        micros = to_micros(timestamp)
+        record = np.array([(micros, price)], RECORD_DTYPE)
+        with self._lock:
+            series_dir = self._series_dir(commodity, create=True)
+            series_file = series_dir / SERIES_FILE
+            size = series_file.stat().st_size if series_file.exists() else 0
+            last = None
+            if size >= RECORD_DTYPE.itemsize:
+                with open(series_file, "rb") as f:
+                    f.seek((size // RECORD_DTYPE.itemsize - 1) * RECORD_DTYPE.itemsize)
+                    last = int(np.frombuffer(f.read(RECORD_DTYPE.itemsize), RECORD_DTYPE)["timestamp"][0])
+
+            self._maps.pop(commodity, None)
+            if (last is None or micros >= last) and size % RECORD_DTYPE.itemsize == 0:
+                with open(series_file, "ab") as f:
+                    f.write(record.tobytes())
+                return
+
+            # Out-of-order write (e.g. a backfill): rewrite the series with the row in place
+            records = np.fromfile(series_file, RECORD_DTYPE, count=size // RECORD_DTYPE.itemsize)
+            index = np.searchsorted(records["timestamp"], micros, side="right")
+            records = np.insert(records, index, record)
+            self._write(series_dir, records["timestamp"], records["price"])
+
+    def _write(self, series_dir, timestamps, prices):
+        records = np.empty(len(timestamps), RECORD_DTYPE)
+        records["timestamp"] = timestamps
+        records["price"] = prices
+        # Replace the file whole, so readers see either the old series or the new one
+        tmp_file = series_dir / f"{SERIES_FILE}.{os.getpid()}.tmp"
+        records.tofile(tmp_file)
+        tmp_file.replace(series_dir / SERIES_FILE)
+
+    def _open(self, commodity):
+        maps = self._maps.get(commodity)
+        # Reuse the mapping unless another process has appended to or rewritten the series
+        if maps is not None and maps[1] == _file_key(maps[0].filename):
+            return maps[0]
+        series_dir = self._series_dir(commodity)
+        series_file = series_dir / SERIES_FILE if series_dir else None
+        if series_file is None or not series_file.exists():
+            return np.empty(0, RECORD_DTYPE)
+        # Map whole records only, in case an append is still being written
+        file_key = _file_key(series_file)
+        length = file_key[1] // RECORD_DTYPE.itemsize
+        if length == 0:
+            return np.empty(0, RECORD_DTYPE)
+        records = np.memmap(series_file, RECORD_DTYPE, mode="r", shape=(length,))
+        self._maps[commodity] = (records, file_key)
+        return records
+
+    def range(self, commodity, start=None, end=None):
+        """
+        Get the prices for a commodity between two timestamps (inclusive).
+        Args:
+            commodity (str): The exact commodity name.
+            start (datetime or str, optional): Earliest timestamp to include.
+            end (datetime or str, optional): Latest timestamp to include.
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Read-only views of epoch microseconds and prices.
+        """
+        with self._lock:
+            records = self._open(commodity)
+        timestamps, prices = records["timestamp"], records["price"]
+        lo = 0 if start is None else np.searchsorted(timestamps, to_micros(start), side="left")
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, to_micros(end), side="right")
+        return timestamps[lo:hi], prices[lo:hi]
+
+    def count(self):
+        """
+        Count the prices held across every series.
+        Returns:
+            int: The number of stored prices.
+        """
+        with self._lock:
+            return sum(len(self._open(commodity)) for commodity in self._load_names())
+
+    def is_stale(self, session):
+        """
+        Check whether the store has fallen out of step with the SQL prices table
+        (e.g. an append failed after the row was committed).
+        Args:
+            session (Session): A SQLAlchemy session.
+        Returns:
+            bool: True if the store should be rebuilt.
+        """
+        rows = session.query(Price)\
+            .join(Commodity, Price.commodity_id == Commodity.id)\
+            .filter(Price.timestamp.isnot(None), Price.price.isnot(None))\
+            .count()
+        return rows != self.count()
+
+    def rebuild(self, session):
+        """
+        Rebuild every series from the SQL prices table.
+        Args:
+            session (Session): A SQLAlchemy session.
+        """
+        rows = session.query(Commodity.name, Price.timestamp, Price.price)\
+            .join(Commodity, Price.commodity_id == Commodity.id)\
+            .order_by(Commodity.name, Price.timestamp)\
+            .all()
+
+        series = {}
+        for commodity, timestamp, price in rows:
+            if commodity is None or timestamp is None or price is None:
+                continue
+            timestamps, prices = series.setdefault(commodity, ([], []))
+            timestamps.append(to_micros(timestamp))
+            prices.append(price)
+
+        with self._lock:
+            self._maps.clear()
+            for commodity in self._load_names():
+                series.setdefault(commodity, ([], []))
+            for commodity, (timestamps, prices) in series.items():
+                self._write(self._series_dir(commodity, create=True), timestamps, prices)
+        print(f"Rebuilt price series for {len(series)} commodities.")
+
+
+series_store = PriceSeriesStore()
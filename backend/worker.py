@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from db import init_db, engine, SessionLocal
+from alerts import alert_engine
+from archive import record_pages
+from fetcher import scrape_prices_timed, ingest_prices
+from jobs import JOB_TIMEOUT, claim_jobs, finish_job, requeue_stale_jobs
+from profiling import save_scrape_profile
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+POLL_INTERVAL = 5  # Seconds between queue checks when idle
+
+
+def init_scrape_process():
+    """
+    Drop the database connections inherited from the parent when a scrape process starts.
+    An SQLite connection used on both sides of a fork can corrupt the database; the
+    scrape processes shouldn't touch it at all, but this keeps any stray use on its own connection.
+    """
+    engine.dispose(close=False)
+
+
+def process_jobs(pool, jobs):
+    """
+    Scrape a batch of claimed jobs in the process pool and ingest the results together.
+    Args:
+        pool (ProcessPoolExecutor): The pool to run the scrapes in.
+        jobs (list[tuple[int, str]]): Claimed (job id, commodity) pairs.
+    """
+    futures = {pool.submit(scrape_prices_timed, commodity): (job_id, commodity) for job_id, commodity in jobs}
+    records, succeeded, pages = [], [], []
+    # Don't let a scrape that hangs despite the request timeouts hold up the batch forever
+    wait(futures, timeout=JOB_TIMEOUT.total_seconds())
+    for future, (job_id, commodity) in futures.items():
+        if future.cancel() or not future.done():
+            job_records, stages, error, job_pages = [], {}, "Timed out", []
+        else:
+            try:
+                job_records, stages, error, job_pages = future.result()
+            except Exception as e:
+                job_records, stages, error, job_pages = [], {}, str(e), []
+        pages += job_pages
+        if error:
+            print(f"Error scraping {commodity} (job {job_id}): {error}")
+            finish_job(job_id, error=error)
+            save_scrape_profile(commodity, stages, error)
+        else:
+            records += job_records
+            succeeded.append((job_id, commodity, stages))
+
+    # The scrape processes archived their pages without recording them, so record
+    # them here, failed scrapes included since those are the pages worth re-parsing
+    try:
+        record_pages(pages)
+    except Exception as e:
+        print(f"Error recording archived pages: {e}")
+
+    # One batched write for everything this round scraped, checked against
+    # the current alert subscriptions (they are managed through the API)
+    error = None
+    if records:
+        session = SessionLocal()
+        try:
+            alert_engine.refresh(session)
+        finally:
+            session.close()
+        try:
+            db_write = ingest_prices(records)
+        except Exception as e:
+            # Nothing from the batch was stored, so every job in it failed
+            error, db_write = f"Error storing prices: {e}", 0.0
+    for job_id, commodity, stages in succeeded:
+        finish_job(job_id, error=error)
+        # The write is batched, so each source is charged the whole batch's write time
+        save_scrape_profile(commodity, {**stages, "db_write": db_write}, error)
+    if error:
+        print(f"Processed {len(jobs)} job(s), stored nothing: {error}")
+    else:
+        print(f"Processed {len(jobs)} job(s), stored {len(records)} price(s).")
+
+
+def run_worker(processes: int = WORKER_PROCESSES, once: bool = False):
+    """
+    Process scrape jobs from the queue until stopped.
+    Args:
+        processes (int): Number of scraper processes.
+        once (bool): Stop once the queue is empty instead of polling.
+    """
+    init_db()
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_scrape_process) as pool:
+        while True:
+            # Another worker may have hung on a job, so look for stale ones on every round
+            requeued = requeue_stale_jobs()
+            if requeued:
+                print(f"Requeued {requeued} stale job(s).")
+            jobs = claim_jobs(processes)
+            if jobs:
+                process_jobs(pool, jobs)
+            elif once:
+                break
+            else:
+                time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a Siphon scrape worker.")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="number of scraper processes")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    run_worker(args.processes, args.once)